@@ -0,0 +1,318 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+from utils.video.video_utils import iter_frame_dir
+from utils.video.pose_utils import FallDetector, POSE_SETTINGS, CASCADE_SETTINGS
+from utils.video.event_summarizer import summarize_event_for_llm
+from utils.video.synthetic_keypoints import generate_keypoint_sequence
+
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
+
+
+def latency_stats(latencies, items=None):
+    """Throughput and latency percentiles (ms) for a list of per-item latencies in seconds."""
+    lat = np.asarray(latencies, dtype=np.float64)
+    total = float(lat.sum())
+    n = len(lat) if items is None else items
+    return {
+        "items": n,
+        "total_s": total,
+        "throughput_per_s": n / total if total > 0 else 0.0,
+        "mean_ms": float(lat.mean() * 1000) if len(lat) else 0.0,
+        "p50_ms": float(np.percentile(lat, 50) * 1000) if len(lat) else 0.0,
+        "p90_ms": float(np.percentile(lat, 90) * 1000) if len(lat) else 0.0,
+        "p99_ms": float(np.percentile(lat, 99) * 1000) if len(lat) else 0.0,
+        "max_ms": float(lat.max() * 1000) if len(lat) else 0.0,
+    }
+
+
+def time_each(fn, items):
+    """Call fn on every item, returning (results, per-item latencies)."""
+    results, latencies = [], []
+    for item in items:
+        start = time.perf_counter()
+        results.append(fn(item))
+        latencies.append(time.perf_counter() - start)
+    return results, latencies
+
+
+def bench_frame_loading(frames_dir, limit):
+    frames, latencies = [], []
+    it = iter_frame_dir(frames_dir)
+    while limit is None or len(frames) < limit:
+        start = time.perf_counter()
+        frame = next(it, None)
+        if frame is None:
+            break
+        latencies.append(time.perf_counter() - start)
+        frames.append(frame)
+    return frames, latency_stats(latencies)
+
+
+def bench_single_pose(frames):
+    import mediapipe as mp
+    from utils.video.pose_utils import get_pose_keypoints
+    pose = mp.solutions.pose.Pose(static_image_mode=False, **POSE_SETTINGS)
+    try:
+        _, latencies = time_each(lambda f: get_pose_keypoints(f, pose), frames)
+    finally:
+        pose.close()
+    return latency_stats(latencies)
+
+
+def bench_multi_pose(frames):
+    from utils.video.multi_pose import MultiPoseEngine
+    from utils.video.pose_utils import get_multiple_pose_keypoints
+    engine = MultiPoseEngine(POSE_SETTINGS)
+    try:
+        keypoints, latencies = time_each(lambda f: get_multiple_pose_keypoints(f, engine), frames)
+        stats = latency_stats(latencies)
+        stats["pose_inferences"] = engine.pose_inferences
+        stats["detector_runs"] = engine.detections
+    finally:
+        engine.close()
+    return keypoints, stats
+
+
+def interval_agreement(reference, intervals, tolerance=0.5):
+    """
+    How well intervals reproduce reference intervals (overlap within tolerance seconds).
+
+    Two empty lists are reported as status "no events" with no scores: they say
+    nothing about whether the two runs agree.
+    """
+    from utils.video.threshold_sweep import score_intervals
+    result = {"status": "ok", "reference": len(reference), "intervals": len(intervals)}
+    if not reference and not intervals:
+        return dict(result, status="no events", precision=None, recall=None, f1=None)
+    truth = np.asarray(sorted(reference), dtype=np.float64).reshape(-1, 2)
+    pred = np.asarray(intervals, dtype=np.float64).reshape(-1, 2)
+    scores = score_intervals(np.zeros(len(pred), dtype=np.int64), pred[:, 0], pred[:, 1], 1, truth, tolerance)
+    result.update({key: float(scores[key][0]) for key in ("precision", "recall", "f1")})
+    return result
+
+
+def fall_flags(keypoints, fps):
+    """Per-frame "a tracked fighter fell" flags: the signal fall intervals are grouped from."""
+    tracker = FallDetector(fps).tracker
+    return np.array([bool(tracker.update(keypoints_list)) for keypoints_list in keypoints], dtype=bool)
+
+
+def flag_agreement(reference, flags):
+    """Per-frame agreement of two fall-flag sequences; f1 over fall frames is None when neither has any."""
+    n = min(len(reference), len(flags))
+    reference, flags = np.asarray(reference[:n], dtype=bool), np.asarray(flags[:n], dtype=bool)
+    n_reference, n_flags = int(reference.sum()), int(flags.sum())
+    return {
+        "frames": n,
+        "reference_fall_frames": n_reference,
+        "fall_frames": n_flags,
+        "frame_agreement": float(np.mean(reference == flags)) if n else None,
+        "f1": 2 * int(np.sum(reference & flags)) / (n_reference + n_flags) if n_reference + n_flags else None,
+    }
+
+
+def agreement_report(reference_keypoints, keypoints, fps):
+    """
+    Compare two keypoint runs of the same frames on per-frame fall flags, on the
+    default intervals and on min_duration=0 intervals (which keep the short
+    groups the default filter drops, so sparse footage still has events to compare).
+    """
+    from utils.video.pose_utils import detect_fall_intervals_from_keypoints
+    return {
+        "fall_flags": flag_agreement(fall_flags(reference_keypoints, fps), fall_flags(keypoints, fps)),
+        "intervals": interval_agreement(detect_fall_intervals_from_keypoints(reference_keypoints, fps),
+                                        detect_fall_intervals_from_keypoints(keypoints, fps)),
+        "intervals_min_duration_0": interval_agreement(
+            detect_fall_intervals_from_keypoints(reference_keypoints, fps, min_duration=0),
+            detect_fall_intervals_from_keypoints(keypoints, fps, min_duration=0)),
+    }
+
+
+def format_agreement(agreement):
+    flags = agreement["fall_flags"]
+    parts = [f"fall-frame F1 {flags['f1']:.2f} ({flags['reference_fall_frames']} vs {flags['fall_frames']} frames)"
+             if flags["f1"] is not None else "no fall frames in either run"]
+    for key, label in (("intervals", "interval"), ("intervals_min_duration_0", "min_duration=0 interval")):
+        scores = agreement[key]
+        parts.append(f"{label} F1 {scores['f1']:.2f}" if scores["f1"] is not None else f"{label}s: no events")
+    return ", ".join(parts)
+
+
+def bench_pose_cascade(frames, fps, heavy_complexity=1, lite_complexity=0):
+    """
+    End-to-end pose + detection with the heavy model on every crop vs the cascade
+    (lite model everywhere, heavy model on ambiguous crops), and how well the
+    cascade agrees with the heavy-only run (see agreement_report).
+    """
+    from utils.video.multi_pose import MultiPoseEngine
+    from utils.video.pose_utils import detect_fall_intervals_from_keypoints, get_multiple_pose_keypoints
+    heavy_settings = dict(POSE_SETTINGS, model_complexity=heavy_complexity)
+    cascade_settings = dict(POSE_SETTINGS, model_complexity=lite_complexity,
+                            cascade=dict(CASCADE_SETTINGS, complexity=heavy_complexity))
+    runs = {}
+    all_keypoints = {}
+    for name, settings in (("heavy", heavy_settings), ("cascade", cascade_settings)):
+        engine = MultiPoseEngine(settings)
+        try:
+            keypoints, latencies = time_each(lambda f: get_multiple_pose_keypoints(f, engine), frames)
+            start = time.perf_counter()
+            intervals = detect_fall_intervals_from_keypoints(keypoints, fps)
+            latencies.append(time.perf_counter() - start)
+            stats = latency_stats(latencies, items=len(frames))
+            stats["pose_inferences"] = engine.pose_inferences
+            stats["escalations"] = engine.escalations
+            stats["escalation_rate"] = engine.escalation_rate
+            stats["intervals"] = intervals
+        finally:
+            engine.close()
+        runs[name] = stats
+        all_keypoints[name] = keypoints
+    heavy, cascade = runs["heavy"], runs["cascade"]
+    return {
+        "heavy_complexity": heavy_complexity,
+        "lite_complexity": lite_complexity,
+        "heavy": heavy,
+        "cascade": cascade,
+        "speedup": heavy["total_s"] / cascade["total_s"] if cascade["total_s"] > 0 else 0.0,
+        "agreement": agreement_report(all_keypoints["heavy"], all_keypoints["cascade"], fps),
+    }
+
+
+def bench_adaptive_sampling(source, fps, uniform_keypoints, coarse_fps=1):
+    """
+    Coarse-to-fine sampling against the uniform pass (uniform_keypoints: pose on every
+    frame of source). Both sides use min_duration=0, so every fall-frame group counts;
+    recall is the share of the uniform intervals the adaptive run also finds.
+    """
+    from utils.video.adaptive_sampling import detect_fall_intervals_adaptive
+    from utils.video.pose_utils import detect_fall_intervals_from_keypoints
+    start = time.perf_counter()
+    intervals, report = detect_fall_intervals_adaptive(source, fps, coarse_fps=coarse_fps, min_duration=0)
+    report["total_s"] = time.perf_counter() - start
+    report["agreement"] = interval_agreement(
+        detect_fall_intervals_from_keypoints(uniform_keypoints, fps, min_duration=0), intervals)
+    return report
+
+
+def bench_detection(keypoint_stream, fps):
+    """Per-frame tracking + grouping latency through the online detector."""
+    detector = FallDetector(fps)
+    latencies = []
+    events = []
+    persons = 0
+    for keypoints_list in keypoint_stream:
+        persons += len(keypoints_list)
+        start = time.perf_counter()
+        events.extend(detector.push_keypoints(keypoints_list))
+        latencies.append(time.perf_counter() - start)
+    events.extend(detector.flush())
+    stats = latency_stats(latencies)
+    stats["events"] = len(events)
+    stats["mean_persons"] = persons / len(latencies) if latencies else 0.0
+    return stats
+
+
+def bench_summarizer(n_events, seed=0):
+    rng = np.random.default_rng(seed)
+    events = []
+    for start in np.sort(rng.uniform(0, 3600, n_events)):
+        duration = float(rng.uniform(0.3, 10.0))
+        events.append({
+            "start_time": float(start),
+            "end_time": float(start) + duration,
+            "duration": duration,
+            "fall_type": "fall",
+            "fall_pose_info": {"fall_velocity": float(rng.uniform(0, 2)), "impact_location": "center"},
+            "context": [{"event": "strike"} if rng.random() < 0.3 else {} for _ in range(10)],
+        })
+    _, latencies = time_each(summarize_event_for_llm, events)
+    return latency_stats(latencies)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every FightSight pipeline stage")
+    parser.add_argument("--frames-dir", default="data/frames/fight1", help="Directory of extracted frames")
+    parser.add_argument("--fps", type=float, default=5, help="Sampling rate the frames were extracted at")
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N frames")
+    parser.add_argument("--skip-pose", action="store_true", help="Skip the MediaPipe stages")
+    parser.add_argument("--pose-cascade", action="store_true",
+                        help="Also compare the lite->heavy pose cascade against the heavy model on every frame")
+    parser.add_argument("--heavy-complexity", type=int, default=1, choices=(1, 2),
+                        help="MediaPipe model the cascade escalates to (and the baseline runs everywhere)")
+    parser.add_argument("--lite-complexity", type=int, default=0, choices=(0, 1),
+                        help="MediaPipe model the cascade runs on every crop")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Also run coarse-to-fine sampling over --frames-dir (ignores --limit) and its recall")
+    parser.add_argument("--coarse-fps", type=float, default=1, help="Coarse pass rate for --adaptive")
+    parser.add_argument("--synthetic-hours", type=float, default=1.0, help="Length of the synthetic keypoint run")
+    parser.add_argument("--synthetic-persons", type=int, default=2)
+    parser.add_argument("--summaries", type=int, default=10000, help="Number of events to summarize")
+    parser.add_argument("--output", default="data/benchmarks/latest.json", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": vars(args),
+        "stages": {},
+    }
+    stages = results["stages"]
+
+    frames, stages["frame_loading"] = bench_frame_loading(args.frames_dir, args.limit)
+    print(f"[BENCH] frame_loading: {stages['frame_loading']['throughput_per_s']:.1f} frames/s")
+
+    if not args.skip_pose and frames:
+        stages["get_pose_keypoints"] = bench_single_pose(frames)
+        print(f"[BENCH] get_pose_keypoints: {stages['get_pose_keypoints']['throughput_per_s']:.1f} frames/s")
+        keypoints, stages["get_multiple_pose_keypoints"] = bench_multi_pose(frames)
+        print(f"[BENCH] get_multiple_pose_keypoints: "
+              f"{stages['get_multiple_pose_keypoints']['throughput_per_s']:.1f} frames/s")
+        stages["detection_real"] = bench_detection(keypoints, args.fps)
+        print(f"[BENCH] detection_real: {stages['detection_real']['throughput_per_s']:.0f} frames/s")
+        if args.pose_cascade:
+            cascade = stages["pose_cascade"] = bench_pose_cascade(frames, args.fps, args.heavy_complexity,
+                                                                  args.lite_complexity)
+            print(f"[BENCH] pose_cascade: {cascade['speedup']:.2f}x vs complexity {args.heavy_complexity} everywhere, "
+                  f"{cascade['cascade']['escalation_rate']:.0%} escalated, "
+                  f"{format_agreement(cascade['agreement'])}")
+        if args.adaptive:
+            adaptive = stages["adaptive_sampling"] = bench_adaptive_sampling(args.frames_dir, args.fps, keypoints,
+                                                                              args.coarse_fps)
+            scores = adaptive["agreement"]
+            recall = f"recall {scores['recall']:.2f}" if scores["recall"] is not None else "no events"
+            print(f"[BENCH] adaptive_sampling: pose on {adaptive['pose_fraction']:.0%} of frames, "
+                  f"{recall} vs the uniform pass ({scores['reference']} vs {scores['intervals']} intervals)")
+
+    n_frames = int(args.synthetic_hours * 3600 * args.fps)
+    stream, truth = generate_keypoint_sequence(n_frames, args.fps, n_persons=args.synthetic_persons)
+    stages["detection_synthetic"] = bench_detection(stream, args.fps)
+    stages["detection_synthetic"]["true_falls"] = len(truth)
+    print(f"[BENCH] detection_synthetic ({n_frames} frames): "
+          f"{stages['detection_synthetic']['throughput_per_s']:.0f} frames/s")
+
+    stages["summarize_event_for_llm"] = bench_summarizer(args.summaries)
+    print(f"[BENCH] summarize_event_for_llm: {stages['summarize_event_for_llm']['throughput_per_s']:.0f} events/s")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[INFO] Benchmark results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
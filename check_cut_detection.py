@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+
+from utils.video.cut_detection import detect_cuts
+from utils.video.video_utils import iter_frame_dir, iter_video_frames
+
+# The frames are committed; the video is not, but gives the same cuts at 5 fps
+FRAMES_DIR = "data/frames/fight1"
+FPS = 5
+# Shot changes in fight1 at 5 fps that must be found
+EXPECTED_CUTS = [127, 200, 344]
+# The labelled knockdown (seconds): one continuous shot with a fast pan and the referee
+# stepping in, which must never be split by a cut
+KNOCKDOWNS = [(62.0, 66.0)]
+
+
+def check_cut_detection(source=FRAMES_DIR, fps=FPS, expected=EXPECTED_CUTS, knockdowns=KNOCKDOWNS):
+    """
+    Returns (cuts, failures): the detected cut frames and a list of failure messages (empty when all checks pass).
+
+    source is a directory of frames already sampled at fps, or a video sampled at fps.
+    """
+    frames = iter_frame_dir(source) if os.path.isdir(source) else iter_video_frames(source, fps=fps)
+    cuts, _ = detect_cuts(frames)
+    failures = [f"missed the cut at frame {c}" for c in expected if c not in cuts]
+    for start, end in knockdowns:
+        inside = [c for c in cuts if start * fps <= c <= end * fps]
+        if inside:
+            failures.append(f"cut(s) {inside} inside the knockdown at {start:.1f}-{end:.1f}s")
+    return cuts, failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if cut detection misses known cuts or splits a knockdown shot")
+    parser.add_argument("--source", default=FRAMES_DIR, help="fight1 frame directory or video")
+    parser.add_argument("--fps", type=float, default=FPS)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source):
+        if args.source != FRAMES_DIR:
+            parser.error(f"{args.source} not found")
+        print(f"[INFO] Skipping the cut check: {FRAMES_DIR} not found (pass --source with fight1 at {FPS:g} fps)")
+        sys.exit(0)
+    cuts, failures = check_cut_detection(args.source, args.fps)
+    print(f"[INFO] Cuts at {args.fps:g} fps: {cuts}")
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"[INFO] All {len(EXPECTED_CUTS)} known cuts found, none inside a knockdown")
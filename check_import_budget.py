@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Entry points a detection-only or replay-from-cache run goes through
+ENTRY_MODULES = [
+    "main",
+    "utils.video.video_utils",
+    "utils.video.pose_utils",
+    "utils.video.keypoint_cache",
+    "utils.video.parallel_pose",
+    "utils.video.threshold_sweep",
+    "utils.video.highlights",
+    "utils.video.fall_classifier",
+    "utils.audio.llm_utils",
+    "utils.audio.transcription_utils",
+    "utils.event_store",
+]
+# Loaded through utils.backends on first use, never at import time
+HEAVY_MODULES = ["torch", "whisper", "mediapipe", "openai", "scipy"]
+BUDGET_S = 0.5
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module, repeats=3):
+    """Cold import time of module (best of repeats, each in a fresh interpreter) and any heavy modules it pulled in."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    env.pop("OPENAI_API_KEY", None)  # importing must not need credentials
+    best = None
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                             capture_output=True, text=True, env=env, cwd=root)
+        if out.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{out.stderr.strip()}")
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    return best
+
+
+def check_import_budget(modules=ENTRY_MODULES, budget=BUDGET_S, repeats=3):
+    """Returns a list of failure messages (empty when every module is within budget and stays light)."""
+    failures = []
+    for module in modules:
+        result = measure_import(module, repeats)
+        status = "ok"
+        if result["heavy"]:
+            status = "FAIL"
+            failures.append(f"{module} imports {', '.join(result['heavy'])} at import time")
+        if result["seconds"] > budget:
+            status = "FAIL"
+            failures.append(f"{module} took {result['seconds']:.3f}s to import (budget {budget:.2f}s)")
+        print(f"{module:<36} {result['seconds'] * 1000:7.1f} ms  {status}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if entry modules import slowly or pull in heavy dependencies")
+    parser.add_argument("--budget", type=float, default=BUDGET_S, help="Per-module cold import budget in seconds")
+    parser.add_argument("--repeats", type=int, default=3, help="Fresh interpreters per module (best time is kept)")
+    parser.add_argument("modules", nargs="*", default=ENTRY_MODULES)
+    args = parser.parse_args()
+
+    failures = check_import_budget(args.modules, args.budget, args.repeats)
+    for failure in failures:
+        print(f"[ERROR] {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"[INFO] All {len(args.modules)} modules within {args.budget:.2f}s and free of {', '.join(HEAVY_MODULES)}")
@@ -0,0 +1,359 @@
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils import instrumentation as metrics
+from utils.run_manifest import RunManifest, RUNS_DIR, write_json_atomic
+from utils.event_store import EventStore, EVENT_DB, join_intervals_points
+from utils.video.video_utils import extract_frames, video_seconds_per_sample
+from utils.video.pose_utils import POSE_SETTINGS, CASCADE_POSE_SETTINGS, iter_frame_keypoints, detect_fall_intervals_from_keypoints
+from utils.video.keypoint_cache import KeypointCache, source_name
+from utils.video.cut_detection import write_shot_index, cut_guard_settings
+from utils.video.event_summarizer import summarize_event_for_llm
+from utils.audio.audio_utils import load_audio_async
+
+os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
+
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".mov", ".avi", ".webm", ".m4v")
+ANNOTATIONS_DIR = "data/annotations"
+
+log = metrics.get_logger("main")
+
+
+def find_videos(paths):
+    """
+    Expand files and directories (non-recursive) into a sorted list of video paths.
+
+    A video reached twice (listed on its own and through its directory, say) is kept
+    once, so two workers never run the same bout.
+    """
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            videos.extend(os.path.join(path, f) for f in sorted(os.listdir(path))
+                          if f.lower().endswith(VIDEO_EXTENSIONS))
+        elif os.path.exists(path):
+            videos.append(path)
+        else:
+            raise FileNotFoundError(f"Video not found: {path}")
+    unique = {}
+    for video in videos:
+        unique.setdefault(os.path.realpath(video), video)
+    if len(unique) < len(videos):
+        log.info(f"Skipping {len(videos) - len(unique)} video(s) given more than once")
+    return list(unique.values())
+
+
+# Each stage takes (manifest, options, audio_future) and returns the path of the artifact it wrote.
+# Stages only read artifacts of the stages listed in STAGE_INPUTS, which is what their input hash covers.
+
+def stage_extract(manifest, options, audio):
+    frames_dir = os.path.join("data/frames", manifest.name)
+    extract_frames(manifest.video_path, frames_dir, fps=options["fps"])
+    return frames_dir
+
+
+def stage_pose(manifest, options, audio):
+    cache = KeypointCache(manifest.video_path, options["fps"], options["pose_settings"])
+    for _ in iter_frame_keypoints(manifest.video_path, cache, options["pose_settings"], options["fps"]):
+        pass
+    return cache.entry_dir
+
+
+def stage_shots(manifest, options, audio):
+    # The cut guard already ran inside the pose stage; its cuts are stored with the keypoints
+    cache = KeypointCache(manifest.video_path, options["fps"], options["pose_settings"])
+    if not cache.complete:
+        raise RuntimeError(f"Keypoint cache for {manifest.name} is incomplete")
+    write_shot_index(manifest.video_path, options["fps"], cache.cuts, cache.frames_done,
+                     manifest.artifact_path("shots"))
+    return manifest.artifact_path("shots")
+
+
+def stage_detect(manifest, options, audio):
+    cache = KeypointCache(manifest.video_path, options["fps"], options["pose_settings"])
+    if not cache.complete:
+        raise RuntimeError(f"Keypoint cache for {manifest.name} is incomplete")
+    intervals = detect_fall_intervals_from_keypoints(cache.replay(), options["fps"],
+                                                     options["min_duration"], options["max_duration"])
+    # The detector counts time as sample / fps; annotations, shots and highlight cuts use source seconds
+    scale = video_seconds_per_sample(manifest.video_path, options["fps"]) * options["fps"]
+    return manifest.write_json("falls", [{"start_time": s * scale, "end_time": e * scale} for s, e in intervals])
+
+
+def stage_transcribe(manifest, options, audio):
+    from utils.audio.transcription_utils import transcribe_audio_chunked
+    # Bouts already run in parallel processes, so each one transcribes its chunks in a single worker
+    segments = transcribe_audio_chunked(audio.result(), options["whisper_model"], workers=1)
+    return manifest.write_json("transcript", segments)
+
+
+def stage_commentary(manifest, options, audio):
+    from utils.audio.llm_utils import analyze_commentary_windowed
+    events, report = analyze_commentary_windowed(manifest.load_json("transcribe"))
+    return manifest.write_json("commentary", {"events": events, "report": report})
+
+
+def stage_classify(manifest, options, audio):
+    from utils.video.fall_classifier import classify_fall_events
+    events = []
+    for fall in manifest.load_json("detect"):
+        start, end = fall["start_time"], fall["end_time"]
+        events.append({"start_time": start, "end_time": end, "duration": end - start, "fall_type": "fall"})
+    summaries = [summarize_event_for_llm(event) for event in events]
+    labels = classify_fall_events(summaries) if summaries else []
+    for event, summary, label in zip(events, summaries, labels):
+        event["summary"] = summary
+        event["fall_type"] = label.strip().lower()
+    return manifest.write_json("classified", events)
+
+
+def stage_export(manifest, options, audio):
+    if not options["skip_classify"]:
+        events = manifest.load_json("classify")
+    else:
+        events = [dict(fall, duration=fall["end_time"] - fall["start_time"], fall_type="fall")
+                  for fall in manifest.load_json("detect")]
+    commentary = [] if options["skip_audio"] else manifest.load_json("commentary")["events"]
+    for event in events:
+        event["commentary"] = []
+    pairs = join_intervals_points([(e["start_time"], e["end_time"]) for e in events],
+                                  [c["timestamp"] for c in commentary], options["commentary_slack"])
+    for i, j in pairs:
+        events[i]["commentary"].append(commentary[j])
+    annotations = {
+        "video": manifest.video_path,
+        "source_hash": manifest.source_hash,
+        "fps": options["fps"],
+        "events": events,
+        "commentary_events": commentary,
+    }
+    if options["cut_guard"]:
+        annotations["shots"] = manifest.load_json("shots")["shots"]
+    path = os.path.join(options["output_dir"], f"{manifest.name}.json")
+    write_json_atomic(path, annotations)
+    store = EventStore(options["event_db"])
+    try:
+        store.add_fight(manifest.name, events, commentary, manifest.video_path, manifest.source_hash,
+                        options["fps"], options["commentary_slack"])
+    finally:
+        store.close()
+    return path
+
+
+def stage_highlights(manifest, options, audio):
+    from utils.video.highlights import export_highlights
+    events = [(e["start_time"], e["end_time"], e["fall_type"]) for e in manifest.load_json("export")["events"]]
+    cache = KeypointCache(manifest.video_path, options["fps"], options["pose_settings"]) if options["overlay"] else None
+    output_dir = manifest.artifact_path("highlights", ext=None)
+    shutil.rmtree(output_dir, ignore_errors=True)  # no stale clips from an earlier run
+    export_highlights(manifest.video_path, events, output_dir, overlay=options["overlay"], keypoint_cache=cache,
+                      keypoint_fps=options["fps"])
+    return output_dir
+
+
+STAGES = [
+    ("extract", stage_extract),
+    ("pose", stage_pose),
+    ("shots", stage_shots),
+    ("detect", stage_detect),
+    ("transcribe", stage_transcribe),
+    ("commentary", stage_commentary),
+    ("classify", stage_classify),
+    ("export", stage_export),
+    ("highlights", stage_highlights),
+]
+
+STAGE_INPUTS = {
+    "extract": (),
+    "pose": (),
+    "shots": ("pose",),
+    "detect": ("pose",),
+    "transcribe": (),
+    "commentary": ("transcribe",),
+    "classify": ("detect",),
+    "export": ("detect", "classify", "commentary", "shots"),
+    "highlights": ("export", "pose"),
+}
+
+
+def stage_config(name, options):
+    """The options a stage's output depends on; changing any of them reruns the stage."""
+    if name == "extract":
+        return {"fps": options["fps"]}
+    if name in ("pose", "shots"):
+        return {"fps": options["fps"], "pose_settings": options["pose_settings"]}
+    if name == "detect":
+        return {"fps": options["fps"], "min_duration": options["min_duration"], "max_duration": options["max_duration"],
+                "times": "source_seconds"}
+    if name == "transcribe":
+        return {"whisper_model": options["whisper_model"]}
+    if name == "export":
+        return {key: options[key] for key in ("commentary_slack", "skip_audio", "skip_classify", "output_dir", "event_db")}
+    if name == "highlights":
+        return {"overlay": options["overlay"]}
+    return {}
+
+
+def enabled_stages(options):
+    skipped = set()
+    if not options["save_frames"]:
+        skipped.add("extract")
+    if not options["cut_guard"]:
+        skipped.add("shots")
+    if options["skip_audio"]:
+        skipped.update(("transcribe", "commentary"))
+    if options["skip_classify"]:
+        skipped.add("classify")
+    if not options["highlights"]:
+        skipped.add("highlights")
+    return [(name, fn) for name, fn in STAGES if name not in skipped]
+
+
+def process_video(video_path, options):
+    """Run every enabled stage of one bout, skipping stages whose manifest entry is still valid."""
+    metrics.reset()
+    manifest = RunManifest(video_path, options["runs_dir"])
+    stages = enabled_stages(options)
+    names = {name for name, _ in stages}
+
+    def inputs_hash(name):
+        upstream = [dep for dep in STAGE_INPUTS[name] if dep in names]
+        return manifest.inputs_hash(name, stage_config(name, options), upstream)
+
+    audio = None
+    if "transcribe" in names and (options["force"] or not manifest.is_done("transcribe", inputs_hash("transcribe"))):
+        # ffmpeg decodes the audio track in the background while pose runs
+        audio = load_audio_async(video_path)
+
+    result = {"video": video_path, "stages": {}, "status": "ok"}
+    for name, fn in stages:
+        stage_hash = inputs_hash(name)
+        if not options["force"] and manifest.is_done(name, stage_hash):
+            result["stages"][name] = "cached"
+            continue
+        log.info(f"{manifest.name}: running {name}")
+        started = time.perf_counter()
+        try:
+            with metrics.stage(name):
+                output = fn(manifest, options, audio)
+        except Exception as e:
+            log.error(f"{manifest.name}: stage {name} failed: {e}")
+            result["status"] = f"failed at {name}"
+            result["error"] = str(e)
+            break
+        elapsed = time.perf_counter() - started
+        manifest.record(name, stage_hash, output, elapsed)
+        result["stages"][name] = round(elapsed, 2)
+
+    if metrics.is_enabled():
+        metrics.export(manifest.artifact_path("metrics"))
+    if result["status"] == "ok":
+        result["annotations"] = manifest.output("export")
+    return result
+
+
+def run(videos, options, workers=None):
+    """
+    Process bouts in parallel worker processes (one bout per worker) and return their results in input order.
+
+    Raises ValueError before any work starts if two videos map to the same bout name
+    (the same file given twice), since they would share a run directory and outputs.
+    """
+    names = {}
+    for video in videos:
+        name = source_name(video)
+        if name in names:
+            raise ValueError(f"{video} and {names[name]} are the same bout ({name}); pass each video once")
+        names[name] = video
+    workers = max(1, min(workers or os.cpu_count() or 1, len(videos)))
+    results = {}
+    if workers == 1:
+        for video in videos:
+            try:
+                results[video] = process_video(video, options)
+            except Exception as e:
+                # Same as a crashed worker: one bad bout must not stop the rest of the batch
+                results[video] = {"video": video, "status": "failed", "error": str(e)}
+            _log_result(results[video])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(process_video, video, options): video for video in videos}
+            for fut in as_completed(futures):
+                video = futures[fut]
+                try:
+                    results[video] = fut.result()
+                except Exception as e:
+                    results[video] = {"video": video, "status": "failed", "error": str(e)}
+                _log_result(results[video])
+    return [results[video] for video in videos]
+
+
+def _log_result(result):
+    if result["status"] == "ok":
+        log.info(f"{result['video']}: done -> {result['annotations']} {result['stages']}")
+    else:
+        log.error(f"{result['video']}: {result['status']}: {result.get('error')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Annotate one or more fight videos (resumes interrupted runs)")
+    parser.add_argument("videos", nargs="+", help="Video files and/or directories of videos")
+    parser.add_argument("--fps", type=float, default=5, help="Sampling rate for pose and fall detection")
+    parser.add_argument("--workers", type=int, default=None, help="Bouts processed in parallel (default: CPU count)")
+    parser.add_argument("--output-dir", default=ANNOTATIONS_DIR, help="Where the per-fight JSON annotations go")
+    parser.add_argument("--runs-dir", default=RUNS_DIR, help="Where stage artifacts and manifests go")
+    parser.add_argument("--event-db", default=EVENT_DB, help="SQLite event store every exported fight is added to")
+    parser.add_argument("--pose-cascade", action="store_true",
+                        help="Run the lite pose model everywhere and the full model only on ambiguous frames")
+    parser.add_argument("--cut-guard", action="store_true",
+                        help="Detect camera cuts: reset fighter tracking and skip transition frames, write a shot index")
+    parser.add_argument("--min-duration", type=float, default=0.3)
+    parser.add_argument("--max-duration", type=float, default=10.0)
+    parser.add_argument("--whisper-model", default="medium")
+    parser.add_argument("--commentary-slack", type=float, default=5.0,
+                        help="Seconds around a fall in which commentary events are attached to it")
+    parser.add_argument("--save-frames", action="store_true", help="Also write sampled frames to data/frames/<video>")
+    parser.add_argument("--skip-audio", action="store_true", help="Skip transcription and commentary analysis")
+    parser.add_argument("--skip-classify", action="store_true", help="Skip LLM classification of falls")
+    parser.add_argument("--highlights", action="store_true",
+                        help="Also cut a clip per event and a highlight reel into data/runs/<video>/highlights")
+    parser.add_argument("--no-overlay", action="store_true",
+                        help="Stream-copy highlight clips instead of re-encoding event windows with pose/label overlays")
+    parser.add_argument("--force", action="store_true", help="Ignore manifests and rerun every stage")
+    args = parser.parse_args()
+
+    options = {
+        "fps": args.fps,
+        "output_dir": args.output_dir,
+        "runs_dir": args.runs_dir,
+        "event_db": args.event_db,
+        "pose_settings": CASCADE_POSE_SETTINGS if args.pose_cascade else POSE_SETTINGS,
+        "cut_guard": args.cut_guard,
+        "min_duration": args.min_duration,
+        "max_duration": args.max_duration,
+        "whisper_model": args.whisper_model,
+        "commentary_slack": args.commentary_slack,
+        "save_frames": args.save_frames,
+        "skip_audio": args.skip_audio,
+        "skip_classify": args.skip_classify,
+        "highlights": args.highlights,
+        "overlay": not args.no_overlay,
+        "force": args.force,
+    }
+    if args.cut_guard:
+        options["pose_settings"] = dict(options["pose_settings"], cut_guard=cut_guard_settings(args.fps))
+    videos = find_videos(args.videos)
+    if not videos:
+        parser.error("no videos found")
+    log.info(f"Processing {len(videos)} video(s)")
+    results = run(videos, options, args.workers)
+    failed = [r for r in results if r["status"] != "ok"]
+    log.info(f"{len(results) - len(failed)} of {len(results)} video(s) annotated")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -2,14 +2,11 @@ import os
 import cv2
 import numpy as np
 from utils.video.pose_utils import get_multiple_pose_keypoints, is_person_lying_down_adaptive, is_person_lying_down, is_fighter_grounded_strict, detect_camera_angle
+from utils.video.frame_store import FrameStore
 import mediapipe as mp
 
-def analyze_frame(frame_path, frame_num, time):
+def analyze_frame(frame, frame_num, time):
     """Analyze a specific frame for grounded detection"""
-    frame = cv2.imread(frame_path)
-    if frame is None:
-        print(f"Could not load frame {frame_path}")
-        return
     
     mp_pose = mp.solutions.pose
     pose = mp_pose.Pose(static_image_mode=True, min_detection_confidence=0.3)
@@ -70,14 +67,20 @@ def analyze_frame(frame_path, frame_num, time):
 
 # Analyze frames around the fall at 64 seconds
 frames_dir = "data/frames/fight1"
+store_dir = "data/frame_stores/fight1"  # python -m utils.video.frame_store data/frames/fight1 --fps 5
 fps = 5
 
 # Analyze frames from 63s to 66s (around the fall)
-for frame_num in range(315, 330):  # frames 315-329 correspond to 63.0s to 65.8s
-    time = frame_num / fps
-    frame_path = os.path.join(frames_dir, f"frame_{frame_num:04d}.jpg")
-    
-    if os.path.exists(frame_path):
-        analyze_frame(frame_path, frame_num, time)
-    else:
-        print(f"Frame {frame_num} not found") 
\ No newline at end of file
+if os.path.exists(os.path.join(store_dir, "meta.json")):
+    store = FrameStore(store_dir)
+    start = store.frame_index(63.0)
+    for frame_num, frame in enumerate(store.time_range(63.0, 66.0), start):  # memory-mapped, no decode
+        analyze_frame(frame, frame_num, store.timestamps[frame_num])
+else:
+    for frame_num in range(315, 330):  # frames 315-329 correspond to 63.0s to 65.8s
+        time = frame_num / fps
+        frame = cv2.imread(os.path.join(frames_dir, f"frame_{frame_num:04d}.jpg"))
+        if frame is not None:
+            analyze_frame(frame, frame_num, time)
+        else:
+            print(f"Frame {frame_num} not found")
@@ -1,7 +1,7 @@
 from utils.video.video_utils import extract_frames
-from utils.audio.audio_utils import extract_audio_from_video
+from utils.audio.audio_utils import extract_audio_from_video, load_audio_pcm
 from utils.audio.transcription_utils import transcribe_audio_whisper
-from utils.audio.llm_utils import analyze_commentary_with_llm
+from utils.audio.llm_utils import analyze_commentary_with_llm, analyze_commentary_windowed
 import json
 import os
 # Testing extract_frames
@@ -25,17 +25,19 @@ def format_segments(segments):
 # print("audio_path: ", audio_path)
 
 # Testing transcribe_audio_whisper
-text = transcribe_audio_whisper("C:/Users/badjo/OneDrive/Documents/FightSight/data/raw_data/fight2.mp4")
+# Audio is decoded to 16 kHz PCM in memory; no WAV file is written
+text = transcribe_audio_whisper(load_audio_pcm("C:/Users/badjo/OneDrive/Documents/FightSight/data/raw_data/fight2.mp4"))
 print("text: ")
 for seg in format_segments(text):
     print(seg)
 
 
-#Testing analyze_segments_with_llm
-events_json = analyze_commentary_with_llm(text)
+#Testing analyze_segments_with_llm (keyword windows only, compared with the single-prompt call)
+events_json, report = analyze_commentary_windowed(text, compare_single_prompt=True)
 
 print("events_json: ")
-print(events_json)
+print(json.dumps(events_json, indent=2))
+print("report: ", report)
 
 
 
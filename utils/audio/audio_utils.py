@@ -1,17 +1,101 @@
-from moviepy.editor import VideoFileClip
+import numpy as np
 import os
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from utils import instrumentation as metrics
 
-def extract_audio_from_video(video_path):
+log = metrics.get_logger(__name__)
+
+SAMPLE_RATE = 16000  # what Whisper expects: 16 kHz mono float32
+
+def _ffmpeg_pcm_command(video_path, sr, channels=1):
+    return [
+        "ffmpeg", "-nostdin", "-loglevel", "error",
+        "-i", video_path,
+        "-vn",  # no video
+        "-f", "f32le",
+        "-acodec", "pcm_f32le",
+        "-ar", str(sr),
+        "-ac", str(channels),
+        "pipe:1"
+    ]
+
+def load_audio_pcm(video_path, sr=SAMPLE_RATE):
+    """Decode the audio track of any media file straight into a float32 mono NumPy array."""
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Video not found: {video_path}")
+    try:
+        with metrics.stage("audio_decode"):
+            out = subprocess.run(_ffmpeg_pcm_command(video_path, sr), capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Audio extraction failed for: {video_path}: {e.stderr.decode(errors='ignore')}")
+    audio = np.frombuffer(out, dtype=np.float32)
+    metrics.count("audio_seconds_decoded", len(audio) / sr)
+    return audio
+
+def iter_audio_blocks(video_path, block_seconds=30.0, sr=SAMPLE_RATE):
+    """
+    Yield the audio track as consecutive float32 blocks of block_seconds (the last may be shorter).
+
+    Raises RuntimeError with ffmpeg's error output if it exits with an error.
+    """
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Video not found: {video_path}")
+    block_bytes = int(block_seconds * sr) * 4
+    # stderr goes to a file rather than a pipe, so a chatty ffmpeg can never block on it
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(_ffmpeg_pcm_command(video_path, sr), stdout=subprocess.PIPE, stderr=stderr)
+        try:
+            while True:
+                buf = proc.stdout.read(block_bytes)
+                if not buf:
+                    break
+                yield np.frombuffer(buf[:len(buf) - len(buf) % 4], dtype=np.float32)
+            if proc.wait() != 0:
+                stderr.seek(0)
+                raise RuntimeError(f"Audio extraction failed for: {video_path}: {stderr.read().decode(errors='ignore')}")
+        finally:
+            proc.stdout.close()
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+
+_loader = ThreadPoolExecutor(max_workers=2, thread_name_prefix="audio")
+
+def load_audio_async(video_path, sr=SAMPLE_RATE):
+    """
+    Start decoding audio in the background and return a Future of the PCM array.
+
+    ffmpeg does the work in its own process, so this overlaps with frame extraction
+    or pose inference on the main thread.
+    """
+    return _loader.submit(load_audio_pcm, video_path, sr)
+
+def extract_audio_from_video(video_path, output_audio_path=None, sr=SAMPLE_RATE, channels=1):
+    """Write the audio track to a WAV file with ffmpeg (only needed when a file on disk is wanted)."""
     if not os.path.exists(video_path):
         raise FileNotFoundError(f"Video not found: {video_path}")
 
-    path_name = video_path.split("/")[-1].split(".")[0];
-    output_audio_path = "data/audio/" + path_name + ".wav"
-    print("output_audio_path: ", output_audio_path)
+    if output_audio_path is None:
+        path_name = os.path.splitext(os.path.basename(video_path))[0]
+        output_audio_path = os.path.join("data/audio", path_name + ".wav")
+    os.makedirs(os.path.dirname(output_audio_path) or ".", exist_ok=True)
 
-    print(f"[INFO] Extracting audio from {video_path}...")
-    clip = VideoFileClip(video_path)
-    clip.audio.write_audiofile(output_audio_path)
-    print(f"[INFO] Audio saved to {output_audio_path}")
+    log.info(f"Extracting audio from {video_path}...")
+    command = [
+        "ffmpeg", "-nostdin", "-y",
+        "-i", video_path,
+        "-vn",  # no video
+        "-acodec", "pcm_s16le",
+        "-ar", str(sr),
+        "-ac", str(channels),
+        output_audio_path
+    ]
+    try:
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    except subprocess.CalledProcessError:
+        raise RuntimeError(f"Audio extraction failed for: {video_path}")
+    log.info(f"Audio saved to {output_audio_path}")
 
-    return output_audio_path
\ No newline at end of file
+    return output_audio_path
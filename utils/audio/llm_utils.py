@@ -1,12 +1,15 @@
-import openai
-from dotenv import load_dotenv
-import os
+import asyncio
+import json
+import re
+import time
+from utils.video.llm_cache import get_cache, hash_text, count_usage, cached_completions
+from utils import instrumentation as metrics
+from utils import backends
 
-load_dotenv()
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+log = metrics.get_logger(__name__)
 
-def analyze_commentary_with_llm(transcribed_text: str) -> list:
-    prompt = f"""
+def build_commentary_prompt(transcribed_text):
+    return f"""
 You are analyzing MMA fight commentary. Your goal is to detect when knockdowns or takedowns from the text. 
 
 Return a JSON array in the following format:
@@ -21,11 +24,183 @@ Here's the transcription:
 \"\"\"
     """
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.3,
-    )
+def analyze_commentary_with_llm(transcribed_text: str) -> list:
+    prompt = build_commentary_prompt(transcribed_text)
+
+    with metrics.stage("llm_call"):
+        response = backends.get("openai").chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.3,
+        )
+    count_usage(response.usage)
 
     # Extract and return parsed event list
     return response.choices[0].message.content
+
+# Staged commentary analysis: local phrase matching picks short windows of the
+# transcript, and only those windows are sent to the LLM.
+COMMENTARY_MODEL = "gpt-4o-mini"
+COMMENTARY_PROMPT_VERSION = 1
+
+EVENT_PATTERNS = [
+    (r"\bdown (?:he|she) goes\b", 3.0),
+    (r"\b(?:drops?|dropped|dropping|floors?|floored|puts? (?:him|her) down|put (?:him|her) down)\b", 2.0),
+    (r"\bknock(?:ed|s)? (?:him |her )?down\b|\bknockdown\b|\bknocked out\b|\bKO\b", 3.0),
+    (r"\btake ?downs?\b|\btook (?:him|her) down\b|\btakes? (?:him|her) down\b", 3.0),
+    (r"\b(?:double|single)[- ]leg\b|\bslam(?:s|med)?\b|\btrip(?:s|ped)?\b|\bsweep(?:s)?\b", 2.0),
+    (r"\bhurt\b|\bwobbl(?:ed|es|y)\b|\brocked\b|\bstunned\b", 1.0),
+    (r"\bslip(?:s|ped)?\b|\bon the (?:canvas|mat|ground)\b|\bfalls?\b|\bfell\b", 1.0),
+]
+_event_regex = [(re.compile(p, re.IGNORECASE), w) for p, w in EVENT_PATTERNS]
+
+WINDOW_PROMPT = """
+You are analyzing MMA fight commentary. Detect knockdowns and takedowns described in the excerpt below.
+Each line starts with its time in seconds from the start of the fight.
+
+Return only a JSON array (no prose), for example:
+[
+  {{ "type": "knockdown", "timestamp": 134.2, "context": "Fighter A drops Fighter B with a right hook." }},
+  {{ "type": "takedown", "timestamp": 279.0, "context": "Fighter B executes a double-leg takedown." }}
+]
+Use the time of the line where the event happens as "timestamp". Return [] if there are none.
+Excerpt:
+\"\"\"
+{excerpt}
+\"\"\"
+"""
+
+def score_segments(segments):
+    """Score each Whisper segment by weighted phrase hits; returns the indices of segments that hit."""
+    hits = []
+    for i, seg in enumerate(segments):
+        score = sum(w * len(rx.findall(seg["text"])) for rx, w in _event_regex)
+        if score > 0:
+            hits.append(i)
+    return hits
+
+def build_windows(segments, hits, before=8.0, after=12.0):
+    """Merge [start - before, end + after] around each hit into (first_idx, last_idx) segment ranges."""
+    windows = []
+    for i in hits:
+        lo, hi = segments[i]["start"] - before, segments[i]["end"] + after
+        first = next(j for j in range(i, -1, -1) if j == 0 or segments[j - 1]["end"] < lo)
+        last = next(j for j in range(i, len(segments)) if j == len(segments) - 1 or segments[j + 1]["start"] > hi)
+        if windows and first <= windows[-1][1] + 1:
+            windows[-1][1] = max(windows[-1][1], last)
+        else:
+            windows.append([first, last])
+    return windows
+
+def _format_excerpt(segments):
+    return "\n".join(f"[{seg['start']:.1f}] {seg['text'].strip()}" for seg in segments)
+
+_encodings = {}
+
+def _count_tokens(text, model=COMMENTARY_MODEL):
+    """Token count with tiktoken; falls back to ~4 characters per token if the encoding is unavailable."""
+    if model not in _encodings:
+        try:
+            import tiktoken
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # tiktoken missing, or its encoding file cannot be downloaded
+            _encodings[model] = None
+    encoding = _encodings[model]
+    return len(encoding.encode(text)) if encoding else len(text) // 4
+
+def parse_events(content):
+    """Parse the model reply into a list of {type, timestamp, context} dicts; [] when there is nothing usable."""
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("\n") + 1:] if "\n" in text else text
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end < start:
+        return []
+    try:
+        raw = json.loads(text[start:end + 1])
+    except ValueError:
+        return []
+    events = []
+    for item in raw:
+        if not isinstance(item, dict) or "type" not in item:
+            continue
+        ts = item.get("timestamp")
+        try:
+            if isinstance(ts, str) and ":" in ts:
+                # "mm:ss" or "h:mm:ss"
+                ts = sum(float(part) * 60 ** i for i, part in enumerate(reversed(ts.split(":"))))
+            ts = float(ts)
+        except (TypeError, ValueError):
+            continue
+        events.append({"type": str(item["type"]).lower(), "timestamp": ts, "context": item.get("context", "")})
+    return events
+
+async def analyze_commentary_windowed_async(segments, model=COMMENTARY_MODEL, concurrency=8, retries=3,
+                                            backoff=1.0, before=8.0, after=12.0, merge_within=5.0,
+                                            async_client=None):
+    """
+    Staged commentary analysis over Whisper segments.
+
+    1. score_segments finds phrases such as "down he goes", "takedown", "drops him".
+    2. build_windows turns hits into small merged time windows of segments.
+    3. Each window is sent to the LLM concurrently (cached by excerpt, model and
+       prompt version) and the reply is parsed into timestamped events.
+    Events of the same type within merge_within seconds are merged. Returns
+    (events, report) where report compares tokens and latency with sending the
+    whole transcript in one prompt.
+    """
+    started = time.perf_counter()
+    hits = score_segments(segments)
+    windows = build_windows(segments, hits, before, after)
+    excerpts = [_format_excerpt(segments[first:last + 1]) for first, last in windows]
+
+    requests = {}
+    for excerpt in excerpts:
+        prompt = WINDOW_PROMPT.format(excerpt=excerpt)
+        # Keyed by the full prompt, so keys never collide with other LLM tasks
+        requests[hash_text(prompt)] = [{"role": "user", "content": prompt}]
+    replies, usage = await cached_completions(get_cache(), requests, model, COMMENTARY_PROMPT_VERSION, concurrency,
+                                              retries, backoff, async_client, what="Commentary window analysis")
+
+    events = []
+    for excerpt in excerpts:
+        events.extend(parse_events(replies.get(hash_text(WINDOW_PROMPT.format(excerpt=excerpt)), "")))
+    events.sort(key=lambda e: e["timestamp"])
+    merged = []
+    last_kept = {}  # type -> timestamp of the last kept event of that type
+    for event in events:
+        # Compared per type, so an event of another type in between doesn't hide a duplicate
+        last = last_kept.get(event["type"])
+        if last is not None and event["timestamp"] - last <= merge_within:
+            continue
+        last_kept[event["type"]] = event["timestamp"]
+        merged.append(event)
+
+    full_text = " ".join(seg["text"].strip() for seg in segments)
+    report = {
+        "segments": len(segments),
+        "hit_segments": len(hits),
+        "windows": len(windows),
+        "segments_sent": sum(last - first + 1 for first, last in windows),
+        "llm_calls": usage["calls"],
+        "prompt_tokens": usage["prompt_tokens"],
+        "completion_tokens": usage["completion_tokens"],
+        "windowed_prompt_tokens_est": sum(_count_tokens(WINDOW_PROMPT.format(excerpt=e)) for e in excerpts),
+        "single_prompt_tokens_est": _count_tokens(build_commentary_prompt(full_text)),
+        "latency_s": time.perf_counter() - started,
+    }
+    return merged, report
+
+def analyze_commentary_windowed(segments, compare_single_prompt=False, **kwargs):
+    """Blocking wrapper; with compare_single_prompt the legacy one-prompt call is also timed into the report."""
+    events, report = asyncio.run(analyze_commentary_windowed_async(segments, **kwargs))
+    if compare_single_prompt:
+        started = time.perf_counter()
+        analyze_commentary_with_llm(" ".join(seg["text"].strip() for seg in segments))
+        report["single_prompt_latency_s"] = time.perf_counter() - started
+    return events, report
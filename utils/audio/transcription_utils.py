@@ -1,16 +1,192 @@
-import whisper
+import atexit
+import numpy as np
 import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from utils.video.keypoint_cache import hash_source
+from utils.audio.audio_utils import SAMPLE_RATE, load_audio_pcm
+from utils import backends
+from utils import instrumentation as metrics
 
-def transcribe_audio_whisper(audio_path, model_size="medium"):
-    if not os.path.exists(audio_path):
-        raise FileNotFoundError(f"Audio file not found: {audio_path}")
+log = metrics.get_logger(__name__)
 
-    print(f"[INFO] Loading Whisper model: {model_size}")
-    model = whisper.load_model(model_size, device="cpu")
-    result = model.transcribe(audio_path, fp16=False, word_timestamps=False)
+TRANSCRIPTS_DIR = "data/transcripts"
+def get_whisper_model(model_size="medium", device="cpu"):
+    """Load each Whisper model size once per process (on first use) and reuse it."""
+    if not backends.is_loaded("whisper", model_size, device):
+        log.info(f"Loading Whisper model: {model_size}")
+        with metrics.stage("whisper_load"):
+            return backends.get("whisper", model_size, device)
+    return backends.get("whisper", model_size, device)
 
-    print(f"[INFO] Transcribing: {audio_path}")
-    # result = model.transcribe(audio_path)
-    
-    print(f"[INFO] Transcription complete.")
-    return result["segments"]
\ No newline at end of file
+def _transcript_cache_path(audio_hash, model_size, chunked):
+    suffix = "_vad" if chunked else ""
+    return os.path.join(TRANSCRIPTS_DIR, f"{audio_hash[:16]}_{model_size}{suffix}.json")
+
+def _load_transcript(path):
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return None
+
+def _save_transcript(path, segments):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(segments, f)
+    os.replace(tmp, path)
+
+def _audio_hash(audio):
+    """Content hash of an audio file path or of an in-memory PCM array."""
+    if isinstance(audio, np.ndarray):
+        return hashlib.sha256(np.ascontiguousarray(audio, dtype=np.float32).tobytes()).hexdigest()
+    if not os.path.exists(audio):
+        raise FileNotFoundError(f"Audio file not found: {audio}")
+    return hash_source(audio)
+
+def transcribe_audio_whisper(audio, model_size="medium", use_cache=True):
+    """
+    Transcribe a media file path or a 16 kHz mono float32 array (see audio_utils.load_audio_pcm).
+
+    Passing the array skips the temporary WAV file and Whisper's own ffmpeg resample.
+    """
+    audio_hash = _audio_hash(audio)
+    cache_path = _transcript_cache_path(audio_hash, model_size, chunked=False) if use_cache else None
+    if cache_path:
+        cached = _load_transcript(cache_path)
+        if cached is not None:
+            log.info(f"Using cached transcript: {cache_path}")
+            metrics.count("transcript_cache_hits")
+            return cached
+
+    model = get_whisper_model(model_size)
+    log.info(f"Transcribing: {audio if isinstance(audio, str) else f'{len(audio) / SAMPLE_RATE:.1f}s of PCM'}")
+    with metrics.stage("transcribe"):
+        result = model.transcribe(audio, fp16=False, word_timestamps=False)
+    if isinstance(audio, np.ndarray):
+        metrics.count("audio_seconds_transcribed", len(audio) / SAMPLE_RATE)
+
+    log.info("Transcription complete.")
+    if cache_path:
+        _save_transcript(cache_path, result["segments"])
+    return result["segments"]
+
+def speech_chunks(audio, sr=SAMPLE_RATE, frame_ms=30, min_silence=0.6, energy_ratio=0.1,
+                  min_energy=1e-3, max_chunk=60.0, pad=0.2):
+    """
+    Energy-based VAD: split audio at silences into (start_sample, end_sample) chunks.
+
+    A 30 ms frame is voiced when its RMS is above max(min_energy, energy_ratio * the
+    95th-percentile RMS). Voiced frames separated by less than min_silence seconds
+    are merged, regions are padded by `pad` seconds, and regions longer than
+    max_chunk seconds are cut so chunks stay balanced across workers. Stretches that
+    never cross the threshold are dropped and never reach Whisper.
+    """
+    frame = int(sr * frame_ms / 1000)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return []
+    rms = np.sqrt(np.mean(audio[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+    threshold = max(min_energy, energy_ratio * np.percentile(rms, 95))
+    voiced = rms > threshold
+    if not voiced.any():
+        return []
+
+    # Rising/falling edges of the voiced mask give speech regions in frame units
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], voiced.astype(np.int8), [0]])))
+    regions = edges.reshape(-1, 2).tolist()
+    gap = int(min_silence * 1000 / frame_ms)
+    merged = [list(regions[0])]
+    for start, end in regions[1:]:
+        if start - merged[-1][1] < gap:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+
+    pad_frames = int(pad * 1000 / frame_ms)
+    max_frames = int(max_chunk * 1000 / frame_ms)
+    chunks = []
+    for start, end in merged:
+        start, end = max(0, start - pad_frames), min(n_frames, end + pad_frames)
+        for s in range(start, end, max_frames):
+            chunks.append((s * frame, min(end, s + max_frames) * frame))
+    return chunks
+
+def _init_transcribe_worker(model_size, threads):
+    backends.module("torch").set_num_threads(threads)
+    get_whisper_model(model_size)
+
+def _transcribe_chunk(args):
+    model_size, audio, offset = args
+    result = get_whisper_model(model_size).transcribe(audio, fp16=False, word_timestamps=False)
+    segments = result["segments"]
+    for seg in segments:
+        seg["start"] += offset
+        seg["end"] += offset
+    return segments
+
+_pools = {}  # model_size -> (workers, ProcessPoolExecutor), kept for the life of the process
+
+def _get_pool(model_size, workers):
+    """The shared worker pool for model_size; replaced only when a different worker count is asked for."""
+    entry = _pools.get(model_size)
+    if entry is not None and entry[0] == workers:
+        return entry[1]
+    if entry is not None:
+        entry[1].shutdown()
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_transcribe_worker,
+                               initargs=(model_size, threads))
+    _pools[model_size] = (workers, pool)
+    return pool
+
+@atexit.register
+def _shutdown_pools():
+    for _, pool in _pools.values():
+        pool.shutdown(cancel_futures=True)
+    _pools.clear()
+
+def transcribe_audio_chunked(audio, model_size="medium", workers=None, use_cache=True, **vad_kwargs):
+    """
+    Transcribe only the voiced chunks of audio (a path or a 16 kHz PCM array) in parallel worker processes.
+
+    The worker pool for each model size is created on first use and reused by later
+    calls, so each worker loads the model once per process; with workers=1 the chunks
+    are transcribed in this process with get_whisper_model instead. Chunk timestamps
+    are shifted back to the global timeline and segment ids renumbered. Results are cached under
+    data/transcripts by audio hash and model size.
+    """
+    cache_path = _transcript_cache_path(_audio_hash(audio), model_size, chunked=True) if use_cache else None
+    if cache_path:
+        cached = _load_transcript(cache_path)
+        if cached is not None:
+            log.info(f"Using cached transcript: {cache_path}")
+            metrics.count("transcript_cache_hits")
+            return cached
+
+    if not isinstance(audio, np.ndarray):
+        audio = load_audio_pcm(audio)
+    with metrics.stage("vad"):
+        chunks = speech_chunks(audio, **vad_kwargs)
+    voiced = sum(e - s for s, e in chunks) / SAMPLE_RATE
+    metrics.count("audio_seconds_transcribed", voiced)
+    log.info(f"VAD kept {len(chunks)} chunks ({voiced:.1f}s of {len(audio) / SAMPLE_RATE:.1f}s)")
+
+    workers = workers or os.cpu_count() or 1
+    jobs = [(model_size, audio[s:e], s / SAMPLE_RATE) for s, e in chunks]
+    segments = []
+    with metrics.stage("transcribe"):
+        if jobs and workers == 1:
+            for job in jobs:
+                segments.extend(_transcribe_chunk(job))
+        elif jobs:
+            for chunk_segments in _get_pool(model_size, workers).map(_transcribe_chunk, jobs):
+                segments.extend(chunk_segments)
+    for i, seg in enumerate(segments):
+        seg["id"] = i
+
+    log.info("Transcription complete.")
+    if cache_path:
+        _save_transcript(cache_path, segments)
+    return segments
@@ -0,0 +1,83 @@
+"""
+Lazily constructed heavy dependencies (API clients, models, big libraries).
+
+Modules register a factory under a name and call get(name, *args) where they need
+the object; nothing is imported or built until that first call, and the result is
+reused for the rest of the process (one instance per distinct args). module(name)
+is the same idea for plain imports such as mediapipe or scipy.optimize, so that
+importing utils.* for frame extraction or interval grouping stays cheap.
+"""
+import importlib
+import os
+import threading
+
+_factories = {}
+_instances = {}
+_lock = threading.RLock()
+
+
+def register(name, factory):
+    """Register (or replace) the factory for name; any cached instances are dropped."""
+    with _lock:
+        _factories[name] = factory
+        for key in [k for k in _instances if k[0] == name]:
+            del _instances[key]
+
+
+def get(name, *args):
+    """The instance for (name, args), built by its factory on first use."""
+    key = (name, args)
+    instance = _instances.get(key)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(key)
+            if instance is None:
+                if name not in _factories:
+                    raise KeyError(f"No backend registered as {name!r}")
+                instance = _instances[key] = _factories[name](*args)
+    return instance
+
+
+def is_loaded(name, *args):
+    """Whether get(name, *args) has been built already (any args if none are given)."""
+    if args:
+        return (name, args) in _instances
+    return any(key[0] == name for key in _instances)
+
+
+def reset(name=None):
+    """Forget cached instances (of one backend, or all) so the next get() rebuilds them."""
+    with _lock:
+        for key in [k for k in _instances if name is None or k[0] == name]:
+            del _instances[key]
+
+
+def module(name):
+    """Import a module on first use (cached by Python's import system afterwards)."""
+    return importlib.import_module(name)
+
+
+def _openai_client():
+    openai = module("openai")
+    module("dotenv").load_dotenv()
+    return openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+
+def openai_async_client():
+    """A new AsyncOpenAI client per call (not cached): async clients are bound to the event loop that uses them."""
+    openai = module("openai")
+    module("dotenv").load_dotenv()
+    return openai.AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+
+def _whisper_model(model_size, device):
+    return module("whisper").load_model(model_size, device=device)
+
+
+def _pose_connections():
+    return sorted(module("mediapipe").solutions.pose.POSE_CONNECTIONS)
+
+
+register("openai", _openai_client)
+register("whisper", _whisper_model)
+register("pose_connections", _pose_connections)
@@ -0,0 +1,192 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+EVENT_DB = "data/events.sqlite3"
+
+
+def join_intervals_points(intervals, points, slack=0.0):
+    """
+    Sort-merge join of (start, end) intervals with point timestamps.
+
+    Returns (interval_index, point_index) pairs for every point inside
+    [start - slack, end + slack]. Both sides are sorted once; a low-water mark over
+    the points only moves forward as interval starts increase, so the cost is
+    O(n log n + m log m + matches) instead of n * m.
+    """
+    order_i = sorted(range(len(intervals)), key=lambda i: intervals[i][0])
+    order_p = sorted(range(len(points)), key=lambda j: points[j])
+    pairs = []
+    lo = 0
+    for i in order_i:
+        start, end = intervals[i][0] - slack, intervals[i][1] + slack
+        while lo < len(order_p) and points[order_p[lo]] < start:
+            lo += 1
+        k = lo
+        while k < len(order_p) and points[order_p[k]] <= end:
+            pairs.append((i, order_p[k]))
+            k += 1
+    return pairs
+
+
+class EventStore:
+    """
+    SQLite store of per-fight results: pose fall intervals (with their LLM labels
+    and summaries), commentary events, and the fall <-> commentary join.
+
+    Falls are indexed by (label, duration) and (fight, start), and commentary by
+    (fight, timestamp), so cross-fight queries such as "knockdowns under 3 s" and
+    time-range lookups use an index instead of reading every annotation file.
+    add_fight replaces everything stored for a fight in one transaction.
+    """
+
+    def __init__(self, path=EVENT_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS fights (
+                id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, video TEXT, source_hash TEXT,
+                fps REAL, added_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS falls (
+                id INTEGER PRIMARY KEY, fight_id INTEGER NOT NULL REFERENCES fights(id) ON DELETE CASCADE,
+                start_time REAL NOT NULL, end_time REAL NOT NULL, duration REAL NOT NULL, label TEXT, summary TEXT);
+            CREATE TABLE IF NOT EXISTS commentary (
+                id INTEGER PRIMARY KEY, fight_id INTEGER NOT NULL REFERENCES fights(id) ON DELETE CASCADE,
+                timestamp REAL NOT NULL, type TEXT, context TEXT);
+            CREATE TABLE IF NOT EXISTS fall_commentary (
+                fall_id INTEGER NOT NULL REFERENCES falls(id) ON DELETE CASCADE,
+                commentary_id INTEGER NOT NULL REFERENCES commentary(id) ON DELETE CASCADE,
+                PRIMARY KEY (fall_id, commentary_id));
+            CREATE INDEX IF NOT EXISTS falls_label_duration ON falls (label, duration);
+            CREATE INDEX IF NOT EXISTS falls_fight_start ON falls (fight_id, start_time);
+            CREATE INDEX IF NOT EXISTS commentary_fight_time ON commentary (fight_id, timestamp);
+            CREATE INDEX IF NOT EXISTS commentary_type ON commentary (type);
+            CREATE INDEX IF NOT EXISTS fall_commentary_commentary ON fall_commentary (commentary_id);
+        """)
+        self.conn.commit()
+
+    def add_fight(self, name, falls, commentary=(), video=None, source_hash=None, fps=None, slack=5.0):
+        """
+        Store one fight's falls ({start_time, end_time, fall_type, summary}) and commentary
+        events ({timestamp, type, context}), replacing any earlier version, and join
+        commentary within slack seconds of each fall. Returns the fight id.
+        """
+        intervals = [(f["start_time"], f["end_time"]) for f in falls]
+        stamps = [c["timestamp"] for c in commentary]
+        pairs = join_intervals_points(intervals, stamps, slack)
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM fights WHERE name = ?", (name,))
+            fight_id = self.conn.execute(
+                "INSERT INTO fights (name, video, source_hash, fps, added_at) VALUES (?, ?, ?, ?, ?)",
+                (name, video, source_hash, fps, time.time())).lastrowid
+            fall_ids = [self.conn.execute(
+                "INSERT INTO falls (fight_id, start_time, end_time, duration, label, summary) VALUES (?, ?, ?, ?, ?, ?)",
+                (fight_id, f["start_time"], f["end_time"], f["end_time"] - f["start_time"],
+                 f.get("fall_type"), f.get("summary"))).lastrowid for f in falls]
+            comment_ids = [self.conn.execute(
+                "INSERT INTO commentary (fight_id, timestamp, type, context) VALUES (?, ?, ?, ?)",
+                (fight_id, c["timestamp"], c.get("type"), c.get("context"))).lastrowid for c in commentary]
+            self.conn.executemany("INSERT INTO fall_commentary VALUES (?, ?)",
+                                  [(fall_ids[i], comment_ids[j]) for i, j in pairs])
+        return fight_id
+
+    def import_annotations(self, path, slack=5.0):
+        """Load one exported data/annotations/<fight>.json (see main.py) into the store."""
+        with open(path, "r") as f:
+            data = json.load(f)
+        name = os.path.splitext(os.path.basename(path))[0]
+        return self.add_fight(name, data["events"], data.get("commentary_events", []), data.get("video"),
+                              data.get("source_hash"), data.get("fps"), slack)
+
+    def falls(self, label=None, min_duration=None, max_duration=None, fights=None):
+        """Falls across all (or the named) fights, filtered by label and duration, via the label/duration index."""
+        clauses, params = [], []
+        if label is not None:
+            clauses.append("falls.label = ?")
+            params.append(label)
+        if min_duration is not None:
+            clauses.append("falls.duration >= ?")
+            params.append(min_duration)
+        if max_duration is not None:
+            clauses.append("falls.duration < ?")
+            params.append(max_duration)
+        if fights is not None:
+            fights = list(fights)
+            clauses.append(f"fights.name IN ({', '.join('?' * len(fights))})")
+            params.extend(fights)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(
+                "SELECT fights.name AS fight, falls.id, falls.start_time, falls.end_time, falls.duration, falls.label,"
+                f" falls.summary FROM falls JOIN fights ON fights.id = falls.fight_id {where}"
+                " ORDER BY fights.name, falls.start_time", params)]
+
+    def falls_in_range(self, fight, t0, t1):
+        """Falls of one fight overlapping [t0, t1]."""
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(
+                "SELECT falls.id, falls.start_time, falls.end_time, falls.duration, falls.label, falls.summary"
+                " FROM falls JOIN fights ON fights.id = falls.fight_id"
+                " WHERE fights.name = ? AND falls.start_time <= ? AND falls.end_time >= ? ORDER BY falls.start_time",
+                (fight, t1, t0))]
+
+    def commentary_in_range(self, fight, t0, t1, type=None):
+        query = ("SELECT commentary.id, commentary.timestamp, commentary.type, commentary.context"
+                 " FROM commentary JOIN fights ON fights.id = commentary.fight_id"
+                 " WHERE fights.name = ? AND commentary.timestamp BETWEEN ? AND ?")
+        params = [fight, t0, t1]
+        if type is not None:
+            query += " AND commentary.type = ?"
+            params.append(type)
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(query + " ORDER BY commentary.timestamp", params)]
+
+    def fused(self, fight):
+        """Falls of one fight, each with the commentary events joined to it."""
+        falls = self.falls(fights=[fight])
+        by_id = {f["id"]: dict(f, commentary=[]) for f in falls}
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT fall_commentary.fall_id, commentary.timestamp, commentary.type, commentary.context"
+                " FROM fall_commentary JOIN commentary ON commentary.id = fall_commentary.commentary_id"
+                " JOIN falls ON falls.id = fall_commentary.fall_id JOIN fights ON fights.id = falls.fight_id"
+                " WHERE fights.name = ? ORDER BY commentary.timestamp", (fight,)).fetchall()
+        for row in rows:
+            by_id[row["fall_id"]]["commentary"].append(
+                {"timestamp": row["timestamp"], "type": row["type"], "context": row["context"]})
+        return list(by_id.values())
+
+    def fights(self):
+        with self._lock:
+            return [dict(row) for row in self.conn.execute("SELECT * FROM fights ORDER BY name")]
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Query the FightSight event store")
+    parser.add_argument("--db", default=EVENT_DB)
+    parser.add_argument("--import-dir", default=None, help="Import every annotations JSON in this directory first")
+    parser.add_argument("--label", default=None, help="e.g. knockdown, takedown, slip")
+    parser.add_argument("--min-duration", type=float, default=None)
+    parser.add_argument("--max-duration", type=float, default=None)
+    parser.add_argument("--fight", action="append", default=None, help="Restrict to these fights (repeatable)")
+    args = parser.parse_args()
+
+    store = EventStore(args.db)
+    if args.import_dir:
+        for f in sorted(os.listdir(args.import_dir)):
+            if f.endswith(".json"):
+                store.import_annotations(os.path.join(args.import_dir, f))
+    for row in store.falls(args.label, args.min_duration, args.max_duration, args.fight):
+        print(f"{row['fight']}\t{row['start_time']:.2f}-{row['end_time']:.2f}s\t{row['duration']:.2f}s\t{row['label']}")
+    store.close()
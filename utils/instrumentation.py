@@ -0,0 +1,193 @@
+"""
+Lightweight per-run instrumentation shared by the pipeline stages.
+
+Stages record wall time with `with stage("pose"):`, counters with
+`count("pose_inferences")` and queue depths with `gauge("writer_queue", n)`.
+Everything is a no-op until enable() is called (or FIGHTSIGHT_METRICS=1 is set),
+so disabled overhead is one boolean check per call. `profile("name")` wraps a hot
+loop in cProfile when profiling is on (FIGHTSIGHT_PROFILE=<dir>). report() returns
+the run's numbers; export() writes them as JSON or Prometheus text.
+"""
+import atexit
+import cProfile
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_enabled = False
+_profile_dir = None
+_stages = {}    # name -> [calls, total_s, max_s]
+_counters = {}  # name -> value
+_gauges = {}    # name -> [last, max]
+_started = time.time()
+
+
+def get_logger(name="fightsight"):
+    """Logger that prints "[LEVEL] message" like the rest of the pipeline; level via FIGHTSIGHT_LOG_LEVEL."""
+    root = logging.getLogger("fightsight")
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+        root.addHandler(handler)
+        root.setLevel(os.getenv("FIGHTSIGHT_LOG_LEVEL", "INFO").upper())
+        root.propagate = False
+    return root if name == "fightsight" else root.getChild(name)
+
+
+def enable(profile_dir=None):
+    """Start collecting metrics; with profile_dir, profile() blocks dump cProfile stats there."""
+    global _enabled, _profile_dir
+    _enabled = True
+    if profile_dir:
+        _profile_dir = profile_dir
+
+
+def disable():
+    global _enabled, _profile_dir
+    _enabled = False
+    _profile_dir = None
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    global _started
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _gauges.clear()
+        _started = time.time()
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            entry = _stages.get(self.name)
+            if entry is None:
+                _stages[self.name] = [1, elapsed, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+                if elapsed > entry[2]:
+                    entry[2] = elapsed
+        return False
+
+
+def stage(name):
+    """Context manager timing one execution of a stage."""
+    return _Stage(name) if _enabled else _NULL_STAGE
+
+
+def count(name, n=1):
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+
+def gauge(name, value):
+    """Record a point-in-time value such as a queue depth (keeps last and max)."""
+    if _enabled:
+        with _lock:
+            entry = _gauges.get(name)
+            if entry is None:
+                _gauges[name] = [value, value]
+            else:
+                entry[0] = value
+                if value > entry[1]:
+                    entry[1] = value
+
+
+@contextmanager
+def profile(name):
+    """cProfile the enclosed block when profiling is enabled; stats go to <profile_dir>/<name>.prof."""
+    if not (_enabled and _profile_dir):
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(_profile_dir, exist_ok=True)
+        path = os.path.join(_profile_dir, f"{name}.prof")
+        profiler.dump_stats(path)
+        top = pstats.Stats(profiler).sort_stats("cumulative")
+        get_logger().info(f"Profile for {name} written to {path} ({top.total_tt:.2f}s profiled)")
+
+
+def report():
+    with _lock:
+        return {
+            "started": _started,
+            "wall_s": time.time() - _started,
+            "stages": {name: {"calls": c, "total_s": t, "max_s": m, "mean_s": t / c}
+                       for name, (c, t, m) in _stages.items()},
+            "counters": dict(_counters),
+            "gauges": {name: {"last": last, "max": peak} for name, (last, peak) in _gauges.items()},
+        }
+
+
+def to_prometheus(data=None):
+    data = data or report()
+    lines = [
+        "# TYPE fightsight_stage_seconds_total counter",
+        *(f'fightsight_stage_seconds_total{{stage="{n}"}} {s["total_s"]:.6f}' for n, s in data["stages"].items()),
+        "# TYPE fightsight_stage_calls_total counter",
+        *(f'fightsight_stage_calls_total{{stage="{n}"}} {s["calls"]}' for n, s in data["stages"].items()),
+        "# TYPE fightsight_stage_max_seconds gauge",
+        *(f'fightsight_stage_max_seconds{{stage="{n}"}} {s["max_s"]:.6f}' for n, s in data["stages"].items()),
+        "# TYPE fightsight_events_total counter",
+        *(f'fightsight_events_total{{name="{n}"}} {v}' for n, v in data["counters"].items()),
+        "# TYPE fightsight_gauge gauge",
+        *(f'fightsight_gauge{{name="{n}",stat="{k}"}} {v}' for n, g in data["gauges"].items() for k, v in g.items()),
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def export(path):
+    """Write the run report; .prom/.txt files get Prometheus text format, anything else JSON."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    data = report()
+    with open(path, "w") as f:
+        if path.endswith((".prom", ".txt")):
+            f.write(to_prometheus(data))
+        else:
+            json.dump(data, f, indent=2)
+    return path
+
+
+if os.getenv("FIGHTSIGHT_METRICS", "") not in ("", "0"):
+    enable(os.getenv("FIGHTSIGHT_PROFILE"))
+    if os.getenv("FIGHTSIGHT_METRICS_OUT"):
+        atexit.register(export, os.getenv("FIGHTSIGHT_METRICS_OUT"))
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import time
+
+from utils.video.keypoint_cache import hash_source, source_name, _source_stamp
+
+RUNS_DIR = "data/runs"
+
+
+def hash_json(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def write_json_atomic(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+class RunManifest:
+    """
+    Per-video record of finished pipeline stages under data/runs/<name>/.
+
+    name is keypoint_cache.source_name of the video ("<stem>-<path digest>"), so two
+    bouts that share a file name in different folders never share a run directory,
+    annotations file or event store row.
+
+    Every stage is stored with the hash of its inputs (video content hash, stage
+    config and the output hashes of the stages it reads) and the content hash of
+    the artifact it wrote. A stage is done only while both still match, so a
+    changed video, config or upstream artifact reruns it and everything after it,
+    and an interrupted run resumes at the first incomplete stage.
+    """
+
+    def __init__(self, video_path, runs_dir=RUNS_DIR):
+        self.video_path = video_path
+        self.name = source_name(video_path)
+        self.run_dir = os.path.join(runs_dir, self.name)
+        self.path = os.path.join(self.run_dir, "manifest.json")
+        data = None
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                data = json.load(f)
+
+        stamp = _source_stamp(video_path)
+        if data and data.get("source_stamp") == stamp:
+            source_hash = data["source_hash"]
+        else:
+            source_hash = hash_source(video_path)
+        if not data or data.get("source_hash") != source_hash:
+            data = {"video": video_path, "source_hash": source_hash, "stages": {}}
+        data["source_stamp"] = stamp
+        self.data = data
+        self.source_hash = source_hash
+
+    def artifact_path(self, name, ext="json"):
+        return os.path.join(self.run_dir, f"{name}.{ext}" if ext else name)
+
+    def inputs_hash(self, stage, config, upstream=()):
+        return hash_json({
+            "stage": stage,
+            "source_hash": self.source_hash,
+            "config": config,
+            "upstream": {name: self.output_hash(name) for name in upstream},
+        })
+
+    def output_hash(self, stage):
+        entry = self.data["stages"].get(stage)
+        return entry["output_hash"] if entry else None
+
+    def is_done(self, stage, inputs_hash):
+        entry = self.data["stages"].get(stage)
+        if entry is None or entry["inputs_hash"] != inputs_hash or not os.path.exists(entry["output"]):
+            return False
+        return hash_source(entry["output"]) == entry["output_hash"]
+
+    def record(self, stage, inputs_hash, output, seconds):
+        self.data["stages"][stage] = {
+            "inputs_hash": inputs_hash,
+            "output": output,
+            "output_hash": hash_source(output),
+            "seconds": seconds,
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        write_json_atomic(self.path, self.data)
+
+    def output(self, stage):
+        return self.data["stages"][stage]["output"]
+
+    def load_json(self, stage):
+        with open(self.output(stage), "r") as f:
+            return json.load(f)
+
+    def write_json(self, name, data):
+        path = self.artifact_path(name)
+        write_json_atomic(path, data)
+        return path
@@ -0,0 +1,151 @@
+import itertools
+import os
+
+import cv2
+import numpy as np
+
+from utils.video.cut_detection import downscale_gray
+from utils.video.fighter_tracking import as_keypoint_array, frame_metrics
+from utils.video.multi_pose import MultiPoseEngine
+from utils.video.pose_utils import POSE_SETTINGS, FallDetector, get_multiple_pose_keypoints
+from utils.video.video_utils import iter_video_frames, count_sampled_frames, list_frame_files
+from utils import instrumentation as metrics
+
+log = metrics.get_logger(__name__)
+
+
+def _iter_source(source, fps, start=0, stop=None, every=1):
+    """
+    Yield (index, frame) at `fps` from a video path or a frame directory.
+
+    A frame directory is assumed to already be sampled at fps. every > 1 keeps only
+    every n-th index; for a video the skipped frames are never decoded, and the kept
+    ones sit on the same source-frame grid as the dense pass.
+    """
+    if os.path.isdir(source):
+        files = list_frame_files(source)
+        for i in range(start, len(files) if stop is None else min(stop, len(files)), every):
+            yield i, cv2.imread(files[i])
+    else:
+        first = -(-start // every) * every
+        yield from zip(itertools.count(first, every),
+                       iter_video_frames(source, fps=fps, start=start, stop=stop, every=every))
+
+
+def _count_frames(source, fps):
+    if os.path.isdir(source):
+        return len(list_frame_files(source))
+    return count_sampled_frames(source, fps)
+
+
+def motion_energy(prev_small, small):
+    """Mean absolute difference of two downscaled grayscale frames, in [0, 1]."""
+    if prev_small is None:
+        return 0.0
+    return float(cv2.absdiff(prev_small, small).mean()) / 255.0
+
+
+def _merge_windows(windows):
+    merged = []
+    for start, stop in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return merged
+
+
+def detect_fall_intervals_adaptive(source, fps, coarse_fps=1, min_duration=0.3, max_duration=10.0,
+                                   motion_floor=0.01, align_band=(0.06, 0.17), align_delta=0.1,
+                                   pre_roll=2.0, post_roll=1.0, thumb_width=64):
+    """
+    Coarse-to-fine fall detection: sparse pose everywhere, dense pose only near candidates.
+
+    Pass 1 walks the video at coarse_fps. Each frame is downscaled to a thumb_width
+    grayscale thumbnail; if its frame-difference energy is below motion_floor (static
+    shot, graphics, break between rounds) pose is skipped entirely. Otherwise sparse
+    pose is run and the frame becomes a candidate when any fighter's hip/shoulder
+    diff lies in align_band (the detector's 0.08-0.15 fall band plus a margin for
+    the frames between samples). Compared with the previous sampled pose, it is also
+    a candidate when the number of people changed, when a sorted diff jumped across
+    the whole band (the fall happened between samples), or, if align_delta is not
+    None, when a sorted diff moved by more than align_delta. Those three triggers
+    cover everything from the previous sample on, since the change happened in between.
+
+    Pass 2 re-reads [t - pre_roll, t + post_roll] around every candidate at the full
+    fps and runs a fresh FallDetector on each merged window; pre_roll must cover the
+    detector's 2 s standing window. Returns (intervals, report) where report counts
+    the pose inferences actually run against a uniform pass at fps.
+    """
+    every = max(1, round(fps / coarse_fps))
+    coarse_engine = MultiPoseEngine(POSE_SETTINGS)
+    candidates = []
+    triggers = {"in_band": 0, "person_count": 0, "band_crossing": 0, "delta": 0}
+    coarse_frames = coarse_inferred = 0
+    prev_small = None
+    prev_diffs = None
+    prev_i = 0
+    try:
+        for i, frame in _iter_source(source, fps, every=every):
+            coarse_frames += 1
+            small = downscale_gray(frame, thumb_width)
+            energy = motion_energy(prev_small, small)
+            prev_small = small
+            if prev_diffs is not None and energy < motion_floor:
+                continue
+            keypoints = as_keypoint_array(get_multiple_pose_keypoints(frame, coarse_engine))
+            coarse_inferred += 1
+            diffs = np.sort(frame_metrics(keypoints)[0])
+            fired = {"in_band": bool(np.any((diffs > align_band[0]) & (diffs < align_band[1])))}
+            if prev_diffs is not None:
+                fired["person_count"] = len(diffs) != len(prev_diffs)
+                if len(diffs) == len(prev_diffs):
+                    low, high = np.minimum(diffs, prev_diffs), np.maximum(diffs, prev_diffs)
+                    fired["band_crossing"] = bool(np.any((low <= align_band[0]) & (high >= align_band[1])))
+                    fired["delta"] = align_delta is not None and bool(np.any(high - low > align_delta))
+            for name, hit in fired.items():
+                triggers[name] += hit
+            if fired["in_band"]:
+                candidates.append((i, i))
+            elif any(fired.values()):
+                candidates.append((prev_i, i))
+            prev_diffs = diffs
+            prev_i = i
+    finally:
+        coarse_engine.close()
+
+    total_frames = _count_frames(source, fps)
+    windows = _merge_windows(
+        (max(0, first - int(pre_roll * fps)), min(total_frames, last + every + int(post_roll * fps)))
+        for first, last in candidates)
+
+    intervals = []
+    dense_inferred = 0
+    for start, stop in windows:
+        detector = FallDetector(fps, min_duration, max_duration)
+        found = []
+        try:
+            for _, frame in _iter_source(source, fps, start, stop):
+                dense_inferred += 1
+                found.extend(detector.push_frame(frame))
+            found.extend(detector.flush())
+        finally:
+            detector.close()
+        # FallDetector counts frames from the start of its window
+        offset = start / fps
+        intervals.extend((s + offset, e + offset) for s, e in found)
+    report = {
+        "frames": total_frames,
+        "coarse_frames": coarse_frames,
+        "coarse_pose_frames": coarse_inferred,
+        "candidates": len(candidates),
+        "triggers": triggers,
+        "dense_windows": len(windows),
+        "dense_pose_frames": dense_inferred,
+        "pose_frames": coarse_inferred + dense_inferred,
+        "uniform_pose_frames": total_frames,
+    }
+    report["pose_fraction"] = report["pose_frames"] / total_frames if total_frames else 0.0
+    log.info(f"Adaptive sampling ran pose on {report['pose_frames']} of {total_frames} frames "
+             f"({report['pose_fraction']:.0%}) in {len(windows)} dense windows")
+    return intervals, report
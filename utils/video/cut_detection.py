@@ -0,0 +1,238 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from utils.video.video_utils import get_video_name, iter_video_frames, video_seconds_per_sample
+from utils import instrumentation as metrics
+
+log = metrics.get_logger(__name__)
+
+SHOTS_DIR = "data/shots"
+THUMB_WIDTH = 64
+HIST_BINS = 32
+SSIM_WINDOW = 7
+# A cut needs both a structural break (low SSIM) and a change in the brightness
+# distribution (histogram distance): fast motion inside one shot lowers SSIM but
+# keeps the histogram, a fade or flash moves the histogram but keeps the structure.
+# On broadcast footage cuts scored SSIM <= 0.23, histogram distance >= 0.14.
+SSIM_THRESH = 0.25
+HIST_THRESH = 0.12
+# A cut is one break out of a steady shot; a whip-pan or a knockdown scramble lowers
+# SSIM over several samples in a row. The frame before a cut must still match the one
+# STEADY_LAG samples earlier: >= 0.47 before the real cuts in fight1 at 5 fps,
+# <= 0.18 around the knockdown at ~63 s and the fast pans that also pass the two tests above.
+STEADY_LAG = 2
+STEADY_THRESH = 0.35
+# Seconds of transition frames skipped from a cut on: cut_guard_settings turns it into
+# skip_frames = int(fps * SKIP_AFTER_CUT), and MultiPoseEngine returns no people for the
+# cut frame and the next skip_frames - 1 frames (always at least the cut frame itself)
+SKIP_AFTER_CUT = 0.5
+
+
+def downscale_gray(frame, width=THUMB_WIDTH):
+    """
+    Shrink a BGR frame to a width-pixel-wide grayscale thumbnail.
+
+    A bilinear resize to 4x the target size followed by INTER_AREA gives the same
+    thumbnails for cut detection at a fraction of the cost of INTER_AREA on the full
+    frame (~0.4 ms vs ~1.6 ms for 720p).
+    """
+    h, w = frame.shape[:2]
+    height = max(1, h * width // w)
+    if w > 4 * width:
+        frame = cv2.resize(frame, (4 * width, 4 * height), interpolation=cv2.INTER_LINEAR)
+    small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+
+def _box_mean(x, k):
+    """Mean over every k x k window of a (n, h, w) stack (valid windows only), via 2-D cumulative sums."""
+    c = np.cumsum(np.cumsum(x, axis=1), axis=2)
+    c = np.pad(c, ((0, 0), (1, 0), (1, 0)))
+    return (c[:, k:, k:] - c[:, :-k, k:] - c[:, k:, :-k] + c[:, :-k, :-k]) / (k * k)
+
+
+def pair_scores(thumbs, bins=HIST_BINS, window=SSIM_WINDOW, lag=1):
+    """
+    Histogram distance and mean SSIM between every thumbnail and the one lag places later.
+
+    thumbs: (n, h, w) uint8 stack. Returns (hist_distance, ssim), each of length
+    n - lag: the total variation distance between normalized gray histograms (0 = same
+    distribution, 1 = disjoint) and the mean local SSIM over window x window boxes.
+    All pairs are scored in a handful of array operations, with no per-frame loop.
+    """
+    n = len(thumbs)
+    if n <= lag:
+        return np.zeros(0), np.ones(0)
+    thumbs = np.asarray(thumbs)
+    pixels = thumbs[0].size
+
+    idx = (thumbs.reshape(n, -1).astype(np.int64) * bins >> 8) + np.arange(n)[:, None] * bins
+    hist = np.bincount(idx.ravel(), minlength=n * bins).reshape(n, bins) / pixels
+    hist_distance = 0.5 * np.abs(hist[lag:] - hist[:-lag]).sum(axis=1)
+
+    x = thumbs[:-lag].astype(np.float64)
+    y = thumbs[lag:].astype(np.float64)
+    k = min(window, *thumbs.shape[1:])
+    mu_x, mu_y = _box_mean(x, k), _box_mean(y, k)
+    var_x = _box_mean(x * x, k) - mu_x ** 2
+    var_y = _box_mean(y * y, k) - mu_y ** 2
+    cov = _box_mean(x * y, k) - mu_x * mu_y
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    ssim = ((2 * mu_x * mu_y + c1) * (2 * cov + c2)) / ((mu_x ** 2 + mu_y ** 2 + c1) * (var_x + var_y + c2))
+    return hist_distance, ssim.reshape(n - lag, -1).mean(axis=1)
+
+
+def is_cut(hist_distance, ssim, ssim_threshold=SSIM_THRESH, hist_threshold=HIST_THRESH):
+    return (ssim < ssim_threshold) & (hist_distance > hist_threshold)
+
+
+def cut_mask(thumbs, ssim_threshold=SSIM_THRESH, hist_threshold=HIST_THRESH, steady_threshold=STEADY_THRESH,
+             steady_lag=STEADY_LAG):
+    """
+    One flag per consecutive pair of thumbs: True where thumbs[i + 1] starts a new shot.
+
+    The pair must pass is_cut and the shot before it must be steady: thumbs[i] still
+    scores SSIM >= steady_threshold against thumbs[i - steady_lag]. Pairs with less
+    history than that are judged by is_cut alone.
+    """
+    thumbs = np.asarray(thumbs)
+    hist_distance, ssim = pair_scores(thumbs)
+    mask = is_cut(hist_distance, ssim, ssim_threshold, hist_threshold)
+    if steady_lag and len(thumbs) > steady_lag + 1:
+        _, steady = pair_scores(thumbs[:-1], lag=steady_lag)
+        mask[steady_lag:] &= steady >= steady_threshold
+    return mask
+
+
+class CutDetector:
+    """
+    Online camera-cut detector: push one frame at a time, get True on the first frame of a new shot.
+
+    Only the last steady_lag + 1 thumbnails are kept, and each frame is judged with
+    cut_mask exactly as detect_cuts would. Costs a resize and a few thousand-pixel
+    array operations per frame, far below one pose inference.
+    """
+
+    def __init__(self, ssim_threshold=SSIM_THRESH, hist_threshold=HIST_THRESH, width=THUMB_WIDTH,
+                 steady_threshold=STEADY_THRESH, steady_lag=STEADY_LAG):
+        self.ssim_threshold = ssim_threshold
+        self.hist_threshold = hist_threshold
+        self.steady_threshold = steady_threshold
+        self.steady_lag = steady_lag
+        self.width = width
+        self.history = []
+        self.cuts = 0
+
+    def push(self, frame):
+        thumb = downscale_gray(frame, self.width)
+        if self.history and self.history[-1].shape != thumb.shape:
+            self.history = []
+        self.history = (self.history + [thumb])[-(self.steady_lag + 2):]
+        if len(self.history) < 2:
+            return False
+        cut = bool(cut_mask(np.stack(self.history), self.ssim_threshold, self.hist_threshold,
+                            self.steady_threshold, self.steady_lag)[-1])
+        if cut:
+            self.cuts += 1
+            metrics.count("camera_cuts")
+        return cut
+
+    def reset(self):
+        self.history = []
+
+
+CUT_DETECTOR_KEYS = ("ssim_threshold", "hist_threshold", "width", "steady_threshold", "steady_lag")
+
+
+def cut_guard_settings(fps, skip_seconds=SKIP_AFTER_CUT, ssim_threshold=SSIM_THRESH, hist_threshold=HIST_THRESH,
+                       width=THUMB_WIDTH, steady_threshold=STEADY_THRESH, steady_lag=STEADY_LAG):
+    """The "cut_guard" entry for pose settings (see MultiPoseEngine), with the skip buffer in frames at fps."""
+    return {"ssim_threshold": ssim_threshold, "hist_threshold": hist_threshold, "width": width,
+            "steady_threshold": steady_threshold, "steady_lag": steady_lag, "skip_frames": int(fps * skip_seconds)}
+
+
+def detect_cuts(frames, ssim_threshold=SSIM_THRESH, hist_threshold=HIST_THRESH, width=THUMB_WIDTH,
+                steady_threshold=STEADY_THRESH, steady_lag=STEADY_LAG, chunk_frames=512):
+    """
+    Frame indices (into frames) that start a new shot.
+
+    frames is any iterable of BGR frames. Thumbnails are buffered chunk_frames at a
+    time and scored with one cut_mask call per chunk; the last steady_lag + 1
+    thumbnails of a chunk are carried over so boundary pairs keep their history and
+    none is missed or counted twice. Returns (cuts, n_frames).
+    """
+    carry = steady_lag + 1
+    chunk_frames = max(chunk_frames, carry + 1)
+    cuts = []
+    chunk = []
+    first = 0  # frame index of chunk[0]
+    scored = 0  # pairs at the start of chunk already scored with the previous chunk
+
+    def chunk_cuts():
+        mask = cut_mask(np.stack(chunk), ssim_threshold, hist_threshold, steady_threshold, steady_lag)
+        return first + 1 + scored + np.flatnonzero(mask[scored:])
+
+    n_frames = 0
+    with metrics.stage("cut_detection"):
+        for frame in frames:
+            chunk.append(downscale_gray(frame, width))
+            n_frames += 1
+            if len(chunk) >= chunk_frames:
+                cuts.extend(chunk_cuts())
+                first += len(chunk) - carry
+                chunk = chunk[-carry:]
+                scored = carry - 1
+        if len(chunk) > scored + 1:
+            cuts.extend(chunk_cuts())
+    metrics.count("camera_cuts", len(cuts))
+    return [int(c) for c in cuts], n_frames
+
+
+def shot_index(cuts, n_frames, fps):
+    """[{shot, start_frame, end_frame, start_time, end_time}] for the shots between cuts (end_frame exclusive)."""
+    bounds = [0] + [c for c in cuts if 0 < c < n_frames] + [n_frames]
+    return [{"shot": i, "start_frame": start, "end_frame": end, "start_time": start / fps, "end_time": end / fps}
+            for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])) if end > start]
+
+
+def write_shot_index(video_path, fps, cuts, n_frames, output_path=None):
+    """
+    Write the shot index JSON for cuts found at the sampling fps (no decoding).
+
+    Times are in seconds of the source video, so they line up with fall intervals
+    detected at the same fps. Returns the index dict.
+    """
+    seconds_per_sample = video_seconds_per_sample(video_path, fps)
+    cuts = [int(c) for c in cuts]
+    shots = shot_index(cuts, n_frames, 1.0 / seconds_per_sample)
+    index = {"video": video_path, "fps": fps, "frames": n_frames, "cuts": cuts,
+             "cut_times": [c * seconds_per_sample for c in cuts], "shots": shots}
+    if output_path is None:
+        output_path = os.path.join(SHOTS_DIR, f"{get_video_name(video_path)}.json")
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(index, f, indent=2)
+    log.info(f"Found {len(cuts)} cut(s), {len(shots)} shot(s) in {video_path} -> {output_path}")
+    return index
+
+
+def build_shot_index(video_path, fps=5, output_path=None, **kwargs):
+    """Standalone pass: detect cuts at the sampling fps and write the shot index JSON (see write_shot_index)."""
+    cuts, n_frames = detect_cuts(iter_video_frames(video_path, fps=fps), **kwargs)
+    return write_shot_index(video_path, fps, cuts, n_frames, output_path)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Detect camera cuts and write a shot index")
+    parser.add_argument("video")
+    parser.add_argument("--fps", type=float, default=5, help="Sampling rate (use the one fall detection runs at)")
+    parser.add_argument("--ssim-threshold", type=float, default=SSIM_THRESH, help="Lower = fewer, more certain cuts")
+    parser.add_argument("--hist-threshold", type=float, default=HIST_THRESH)
+    parser.add_argument("--output", default=None, help="JSON path (default: data/shots/<video>.json)")
+    args = parser.parse_args()
+    build_shot_index(args.video, args.fps, args.output, ssim_threshold=args.ssim_threshold,
+                     hist_threshold=args.hist_threshold)
@@ -1,22 +1,28 @@
 import argparse
 from utils.video.video_utils import extract_frames, extract_audio, get_video_name
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-def main(video_path):
+def main(video_path, fps=1, workers=1):
     video_name = get_video_name(video_path)
 
     # Set output directories
     frames_dir = os.path.join("data/frames", video_name)
     audio_path = os.path.join("data/audio", f"{video_name}.wav")
 
-    print(f"[INFO] Extracting frames to: {frames_dir}")
-    extract_frames(video_path, frames_dir)
-
+    # ffmpeg writes the audio in its own process while frames are decoded here
     print(f"[INFO] Extracting audio to: {audio_path}")
-    extract_audio(video_path, audio_path)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        audio_job = pool.submit(extract_audio, video_path, audio_path)
+
+        print(f"[INFO] Extracting frames to: {frames_dir}")
+        extract_frames(video_path, frames_dir, fps=fps, workers=workers)
+        audio_job.result()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Extract frames and audio from a video")
     parser.add_argument("--video", type=str, required=True, help="Path to the input video")
+    parser.add_argument("--fps", type=float, default=1, help="Frames per second to sample")
+    parser.add_argument("--workers", type=int, default=1, help="Processes decoding video segments in parallel")
     args = parser.parse_args()
-    main(args.video)
\ No newline at end of file
+    main(args.video, fps=args.fps, workers=args.workers)
\ No newline at end of file
@@ -1,27 +1,26 @@
-import openai
-import os
-from dotenv import load_dotenv
-import json
-import hashlib
-load_dotenv()
-CACHE_FILE = "data/cache/llm_fall_classifications.json"
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-
-if os.path.exists(CACHE_FILE):
-    with open(CACHE_FILE, "r") as f:
-        llm_cache = json.load(f)
-else:
-    llm_cache = {}
-
-def hash_text(text):
-    return hashlib.sha256(text.encode()).hexdigest()
-
-def save_cache():
-    with open(CACHE_FILE, "w") as f:
-        json.dump(llm_cache, f)
-
-def classify_fall_event_with_llm(summary_text):
+import asyncio
+from utils.video import llm_cache
+from utils.video.llm_cache import hash_text, count_usage, cached_completions
+from utils import instrumentation as metrics
+from utils import backends
+log = metrics.get_logger(__name__)
+CACHE_FILE = "data/cache/llm_fall_classifications.json"  # legacy JSON cache, imported into CACHE_DB once
+MODEL = "gpt-4o-mini"
+PROMPT_VERSION = 1
+SYSTEM_PROMPT = "You are an expert MMA fight event classifier. You are given a description of a fall event and you need to classify it as either a knockdown, takedown, or slip."
+
+_legacy_imported = False
+
+def get_cache():
+    """The shared LLM cache, with the legacy classification JSON imported into it on first use."""
+    global _legacy_imported
+    cache = llm_cache.get_cache()
+    if not _legacy_imported:
+        cache.import_json(CACHE_FILE, MODEL, PROMPT_VERSION)
+        _legacy_imported = True
+    return cache
+
+def build_messages(summary_text):
     prompt = f"""
 You are an expert MMA fight analyst. Classify the type of fall described below as either:
 - knockdown
@@ -35,24 +34,49 @@ Description:
 
 Respond only with the classification.
 """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
 
+def classify_fall_event_with_llm(summary_text, model=MODEL):
+    cache = get_cache()
     hash_key = hash_text(summary_text)
-    if hash_key in llm_cache:
-        return llm_cache[hash_key]
+    cached = cache.get(hash_key, model, PROMPT_VERSION)
+    if cached is not None:
+        return cached
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  
-            messages=[
-                {"role": "system", "content": "You are an expert MMA fight event classifier. You are given a description of a fall event and you need to classify it as either a knockdown, takedown, or slip."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0,
-        )
+        with metrics.stage("llm_call"):
+            response = backends.get("openai").chat.completions.create(
+                model=model,
+                messages=build_messages(summary_text),
+                temperature=0,
+            )
+        count_usage(response.usage)
         result = response.choices[0].message.content
-        llm_cache[hash_key] = result
-        save_cache()
+        cache.put(hash_key, model, PROMPT_VERSION, result)
         return result
     except Exception as e:
-        print(f"[ERROR] LLM classification failed: {e}")
+        metrics.count("llm_errors")
+        log.error(f"LLM classification failed: {e}")
         return "unknown"
+
+async def classify_fall_events_async(summaries, model=MODEL, concurrency=8, retries=3, backoff=1.0,
+                                     async_client=None):
+    """
+    Classify many event summaries concurrently; returns labels in input order.
+
+    Cached summaries are answered from the cache, duplicate summaries are sent once,
+    at most `concurrency` requests are in flight, and failed requests are retried
+    with exponential backoff before falling back to "unknown".
+    """
+    keys = [hash_text(s) for s in summaries]
+    requests = {key: build_messages(summary) for key, summary in zip(keys, summaries)}
+    results, _ = await cached_completions(get_cache(), requests, model, PROMPT_VERSION, concurrency, retries,
+                                          backoff, async_client, what="LLM classification")
+    return [results.get(key, "unknown") for key in keys]
+
+def classify_fall_events(summaries, **kwargs):
+    """Blocking wrapper around classify_fall_events_async."""
+    return asyncio.run(classify_fall_events_async(summaries, **kwargs))
@@ -0,0 +1,148 @@
+import numpy as np
+from utils import backends
+
+# MediaPipe PoseLandmark indices used by the fall heuristics
+LEFT_SHOULDER, RIGHT_SHOULDER = 11, 12
+LEFT_HIP, RIGHT_HIP = 23, 24
+VISIBILITY_THRESHOLD = 0.3
+# Default fall thresholds on |shoulder y - hip y| (normalized frame units)
+ALIGN_THRESHOLD = 0.08
+DROP_THRESHOLD = 0.15
+STAND_THRESHOLD = 0.08
+TORSO = [LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_HIP, RIGHT_HIP]
+
+
+def as_keypoint_array(keypoints_list):
+    """Stack a list of per-person keypoints into a (persons, 33, 3) float64 array."""
+    if len(keypoints_list) == 0:
+        return np.zeros((0, 33, 3))
+    return np.asarray(keypoints_list, dtype=np.float64).reshape(len(keypoints_list), -1, 3)
+
+
+def frame_metrics(keypoints):
+    """
+    Hip/shoulder alignment and body center for every person in one call.
+
+    keypoints: (persons, 33, 3) array of (x, y, visibility).
+    Returns (diffs, centers): |mean shoulder y - mean hip y| per person, and the
+    mean (x, y) of landmarks with visibility > 0.3 ((0, 0) when none are visible).
+    """
+    hips_y = (keypoints[:, LEFT_HIP, 1] + keypoints[:, RIGHT_HIP, 1]) / 2
+    shoulders_y = (keypoints[:, LEFT_SHOULDER, 1] + keypoints[:, RIGHT_SHOULDER, 1]) / 2
+    diffs = np.abs(hips_y - shoulders_y)
+
+    visible = keypoints[:, :, 2] > VISIBILITY_THRESHOLD
+    counts = visible.sum(axis=1)
+    sums = (keypoints[:, :, :2] * visible[:, :, None]).sum(axis=1)
+    centers = np.divide(sums, counts[:, None], out=np.zeros_like(sums), where=counts[:, None] > 0)
+    return diffs, centers
+
+
+def ambiguous_persons(keypoints, min_visibility=0.5, margin=0.03,
+                      thresholds=(ALIGN_THRESHOLD, DROP_THRESHOLD), drop_threshold=DROP_THRESHOLD):
+    """
+    Which people in one frame a cheap pose result cannot be trusted for.
+
+    keypoints: (persons, 33, 3) array. Returns (ambiguous, grounded) boolean masks:
+    ambiguous when the mean torso visibility is below min_visibility or the
+    hip/shoulder diff lies within margin of any fall threshold; grounded when the
+    diff is below drop_threshold + margin, i.e. the person may be down.
+    """
+    diffs, _ = frame_metrics(keypoints)
+    low_visibility = keypoints[:, TORSO, 2].mean(axis=1) < min_visibility
+    near = (np.abs(diffs[:, None] - np.asarray(thresholds)[None, :]) < margin).any(axis=1)
+    grounded = diffs < drop_threshold + margin
+    return low_visibility | near, grounded
+
+
+class FighterTrack:
+    """One tracked person: last center, a fixed-size ring of past diffs and a standing counter."""
+
+    __slots__ = ("center", "diffs", "head", "size", "above", "stand_counter")
+
+    def __init__(self, center, window, stand_window):
+        self.center = center
+        self.diffs = np.zeros(max(window, 1))
+        self.head = 0
+        self.size = 0
+        self.above = 0  # diffs in the ring above the align threshold
+        self.stand_counter = stand_window
+
+    def push(self, diff, align_threshold, window):
+        if window <= 0:
+            return
+        if self.size == window:
+            if self.diffs[self.head] > align_threshold:
+                self.above -= 1
+        else:
+            self.size += 1
+        self.diffs[self.head] = diff
+        if diff > align_threshold:
+            self.above += 1
+        self.head = (self.head + 1) % window
+
+
+class FighterTracker:
+    """
+    Frame-to-frame fighter tracking and per-frame fall detection.
+
+    Each frame, metrics for all people are computed in one vectorized call and
+    people are matched to existing tracks by optimal assignment over the full
+    center-distance matrix. A person triggers a fall when they have been standing
+    (diff > stand_threshold) for stand_window frames, any diff in the last window
+    frames exceeded align_threshold, and the current diff is below drop_threshold.
+    """
+
+    def __init__(self, window, stand_window, align_threshold=ALIGN_THRESHOLD, drop_threshold=DROP_THRESHOLD,
+                 stand_threshold=STAND_THRESHOLD):
+        self.window = window
+        self.stand_window = stand_window
+        self.align_threshold = align_threshold
+        self.drop_threshold = drop_threshold
+        self.stand_threshold = stand_threshold
+        self.tracks = []
+
+    def _new_track(self, center):
+        return FighterTrack(center, self.window, self.stand_window)
+
+    def update(self, keypoints_list):
+        """Advance one frame; returns True if any tracked person fell in this frame."""
+        keypoints = as_keypoint_array(keypoints_list)
+        if len(keypoints) == 0:
+            self.tracks = []
+            return False
+        diffs, centers = frame_metrics(keypoints)
+        if not self.tracks:
+            self.tracks = [self._new_track(c) for c in centers]
+            return False
+
+        prev_centers = np.stack([t.center for t in self.tracks])
+        dist = np.linalg.norm(centers[:, None, :] - prev_centers[None, :, :], axis=2)
+        rows, cols = backends.module("scipy.optimize").linear_sum_assignment(dist)
+        assigned = np.full(len(centers), -1)
+        assigned[rows] = cols
+
+        new_tracks = []
+        fall_detected = False
+        for idx, center in enumerate(centers):
+            t_idx = assigned[idx]
+            if fall_detected or t_idx < 0:
+                # Evaluation stops at the first fall this frame; everyone after starts a fresh track
+                new_tracks.append(self._new_track(center))
+                continue
+            track = self.tracks[t_idx]
+            curr_diff = diffs[idx]
+            if curr_diff > self.stand_threshold:
+                track.stand_counter = min(track.stand_counter + 1, self.stand_window)
+            else:
+                track.stand_counter = 0
+            if (track.stand_counter >= self.stand_window and track.above > 0
+                    and curr_diff < self.drop_threshold):
+                fall_detected = True
+                new_tracks.append(self._new_track(center))
+                continue
+            track.push(curr_diff, self.align_threshold, self.window)
+            track.center = center
+            new_tracks.append(track)
+        self.tracks = new_tracks
+        return fall_detected
@@ -0,0 +1,191 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from utils.video.video_utils import get_video_name, iter_video_frames, iter_frame_dir, video_seconds_per_sample
+from utils import instrumentation as metrics
+
+log = metrics.get_logger(__name__)
+
+FRAME_STORE_DIR = "data/frame_stores"
+STORE_WIDTH = 480  # the person detector's working width; pose crops are resized to 256 px by MediaPipe anyway
+FORMAT_VERSION = 1
+
+
+def _resize(frame, width):
+    h, w = frame.shape[:2]
+    if w == width:
+        return frame
+    height = max(1, round(h * width / w))
+    return cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+class FrameStoreWriter:
+    """
+    Appends BGR frames to a frame store, resized to a fixed width.
+
+    Frames are buffered and written chunk_frames at a time to frames.u8, a raw
+    (frames, height, width, 3) uint8 array, so the frame count does not need to be
+    known up front. close() writes timestamps.npy and meta.json; until then the
+    store is not readable. Leaving a with-block on an exception calls abort()
+    instead, so a partial store is never finalized.
+    """
+
+    def __init__(self, store_dir, width=STORE_WIDTH, fps=None, source=None, chunk_frames=64):
+        self.store_dir = store_dir
+        self.width = width
+        self.fps = fps
+        self.source = source
+        self.chunk_frames = chunk_frames
+        self.shape = None
+        self.count = 0
+        self.timestamps = []
+        self._chunk = []
+        os.makedirs(store_dir, exist_ok=True)
+        if os.path.exists(os.path.join(store_dir, "meta.json")):
+            os.remove(os.path.join(store_dir, "meta.json"))
+        self._file = open(os.path.join(store_dir, "frames.u8"), "wb")
+
+    def append(self, frame, timestamp=None):
+        frame = _resize(frame, self.width)
+        if self.shape is None:
+            self.shape = frame.shape
+        elif frame.shape != self.shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match store shape {self.shape}")
+        if timestamp is None:
+            timestamp = self.count / self.fps if self.fps else float(self.count)
+        self.timestamps.append(timestamp)
+        self._chunk.append(frame)
+        self.count += 1
+        if len(self._chunk) >= self.chunk_frames:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        if self._chunk:
+            self._file.write(np.ascontiguousarray(np.stack(self._chunk)).tobytes())
+            self._chunk = []
+
+    def close(self):
+        self._write_chunk()
+        self._file.close()
+        np.save(os.path.join(self.store_dir, "timestamps.npy"), np.asarray(self.timestamps, dtype=np.float64))
+        meta = {
+            "version": FORMAT_VERSION,
+            "count": self.count,
+            "shape": list(self.shape) if self.shape else [0, self.width, 3],
+            "fps": self.fps,
+            "source": self.source,
+        }
+        with open(os.path.join(self.store_dir, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+
+    def abort(self):
+        """Drop a partially written store: frames.u8 is removed and no meta.json is written."""
+        self._chunk = []
+        self._file.close()
+        for name in ("frames.u8", "timestamps.npy"):
+            path = os.path.join(self.store_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+class FrameStore:
+    """
+    Read-only, memory-mapped view of a frame store written by FrameStoreWriter.
+
+    store[i], store.range(start, stop) and store.time_range(t0, t1) return slices of
+    the memory map: no decode and no copy, only the pages touched are read from disk.
+    Iterating yields frames in order, so a FrameStore can be passed straight to
+    detect_fall_intervals (and to KeypointCache as the source path via store.store_dir).
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        meta_path = os.path.join(store_dir, "meta.json")
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"Frame store not found or not finished: {store_dir}")
+        with open(meta_path, "r") as f:
+            self.meta = json.load(f)
+        self.fps = self.meta["fps"]
+        self.timestamps = np.load(os.path.join(store_dir, "timestamps.npy"))
+        count, shape = self.meta["count"], tuple(self.meta["shape"])
+        if count:
+            self.frames = np.memmap(os.path.join(store_dir, "frames.u8"), dtype=np.uint8, mode="r",
+                                    shape=(count,) + shape)
+        else:
+            self.frames = np.zeros((0,) + shape, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    def __iter__(self):
+        for i in range(len(self.frames)):
+            yield self.frames[i]
+
+    def range(self, start, stop):
+        """Frames [start, stop) as one (n, h, w, 3) view."""
+        return self.frames[start:stop]
+
+    def frame_index(self, t):
+        """Index of the first frame at or after t seconds."""
+        return int(np.searchsorted(self.timestamps, t, side="left"))
+
+    def time_range(self, t0, t1):
+        """Frames with t0 <= timestamp < t1 as one view."""
+        return self.frames[self.frame_index(t0):self.frame_index(t1)]
+
+
+def _store_dir_for(source, store_dir):
+    return store_dir or os.path.join(FRAME_STORE_DIR, get_video_name(os.path.normpath(source)))
+
+
+def frame_store_from_dir(frames_dir, fps, store_dir=None, width=STORE_WIDTH):
+    """Convert a directory of extracted frame_NNNN.jpg files (sampled at fps) into a frame store."""
+    store_dir = _store_dir_for(frames_dir, store_dir)
+    with metrics.stage("frame_store_convert"), \
+            FrameStoreWriter(store_dir, width, fps, source=frames_dir) as writer:
+        for frame in iter_frame_dir(frames_dir):
+            writer.append(frame)
+    log.info(f"Converted {writer.count} frames from {frames_dir} to {store_dir}")
+    return FrameStore(store_dir)
+
+
+def frame_store_from_video(video_path, fps=1, store_dir=None, width=STORE_WIDTH):
+    """Decode a video once at the sampling fps into a frame store, with source timestamps."""
+    store_dir = _store_dir_for(video_path, store_dir)
+    seconds_per_sample = video_seconds_per_sample(video_path, fps)
+    with metrics.stage("frame_store_convert"), \
+            FrameStoreWriter(store_dir, width, fps, source=video_path) as writer:
+        for i, frame in enumerate(iter_video_frames(video_path, fps=fps)):
+            writer.append(frame, i * seconds_per_sample)
+    log.info(f"Stored {writer.count} frames from {video_path} in {store_dir}")
+    return FrameStore(store_dir)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert a video or a JPEG frame directory into a frame store")
+    parser.add_argument("source", help="Video file or directory of frame_NNNN.jpg files")
+    parser.add_argument("--fps", type=float, default=5, help="Sampling rate (of the video, or that the JPEGs were extracted at)")
+    parser.add_argument("--width", type=int, default=STORE_WIDTH)
+    parser.add_argument("--output", default=None, help="Store directory (default: data/frame_stores/<name>)")
+    args = parser.parse_args()
+    if os.path.isdir(args.source):
+        frame_store_from_dir(args.source, args.fps, args.output, args.width)
+    else:
+        frame_store_from_video(args.source, args.fps, args.output, args.width)
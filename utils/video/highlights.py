@@ -0,0 +1,213 @@
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+
+import cv2
+import numpy as np
+
+from utils import backends
+from utils.video.video_utils import seconds_per_sample
+from utils import instrumentation as metrics
+
+log = metrics.get_logger(__name__)
+
+LABEL_COLORS = {"knockdown": (0, 0, 255), "takedown": (0, 165, 255), "slip": (0, 255, 255)}
+VISIBILITY_THRESHOLD = 0.3
+
+
+def _pose_connections():
+    return backends.get("pose_connections")
+
+
+def _run_ffmpeg(args):
+    try:
+        subprocess.run(["ffmpeg", "-nostdin", "-y", "-loglevel", "error"] + args,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg failed: {e.stderr.decode(errors='ignore').strip()}")
+
+
+def merge_windows(events, pre_roll=2.0, post_roll=2.0, duration=None):
+    """
+    Pad each (start, end, label) event by pre/post roll and merge overlapping windows.
+
+    Returns [(start, end, [event, ...])] sorted by start, so no part of the bout is
+    cut or rendered twice.
+    """
+    windows = []
+    for event in sorted(events, key=lambda e: e[0]):
+        start = max(0.0, event[0] - pre_roll)
+        end = event[1] + post_roll if duration is None else min(duration, event[1] + post_roll)
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+            windows[-1][2].append(event)
+        else:
+            windows.append([start, end, [event]])
+    return [tuple(w) for w in windows]
+
+
+def cut_clip(video_path, start, end, output_path):
+    """
+    Stream-copy [start, end] of video_path without re-encoding.
+
+    Input seeking with -c copy starts the clip on the keyframe at or before start,
+    so the clip may begin slightly early but costs only I/O.
+    """
+    _run_ffmpeg(["-ss", f"{start:.3f}", "-i", video_path, "-t", f"{end - start:.3f}",
+                 "-map", "0:v:0", "-map", "0:a?", "-c", "copy", "-avoid_negative_ts", "make_zero", output_path])
+    return output_path
+
+
+def draw_overlay(frame, keypoints_list=(), label=None):
+    """Draw pose skeletons (normalized (33, 3) keypoints) and an event label onto a BGR frame in place."""
+    h, w = frame.shape[:2]
+    color = LABEL_COLORS.get(label, (255, 255, 255))
+    for keypoints in keypoints_list:
+        kp = np.asarray(keypoints)
+        pts = (kp[:, :2] * (w, h)).astype(int)
+        visible = kp[:, 2] > VISIBILITY_THRESHOLD
+        for a, b in _pose_connections():
+            if visible[a] and visible[b]:
+                cv2.line(frame, tuple(pts[a]), tuple(pts[b]), (0, 255, 0), 2, cv2.LINE_AA)
+        for x, y in pts[visible]:
+            cv2.circle(frame, (int(x), int(y)), 3, (255, 255, 255), -1, cv2.LINE_AA)
+    if label:
+        (tw, th), _ = cv2.getTextSize(label.upper(), cv2.FONT_HERSHEY_SIMPLEX, 0.9, 2)
+        cv2.rectangle(frame, (10, 10), (22 + tw, 22 + th + 8), (0, 0, 0), -1)
+        cv2.putText(frame, label.upper(), (16, 16 + th), cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2, cv2.LINE_AA)
+    return frame
+
+
+def render_overlay_clip(video_path, start, end, output_path, events=(), keypoint_cache=None, keypoint_fps=None,
+                        crf=20, preset="veryfast", queue_size=32):
+    """
+    Re-encode only [start, end] of video_path with skeleton and label overlays.
+
+    Frames are decoded on this thread; drawing and piping raw frames into ffmpeg
+    (libx264, audio from the same window) happen on a writer thread behind a bounded
+    queue. events are (start, end, label) tuples; a label is shown while its event
+    is active. Keypoints come from a KeypointCache sampled at keypoint_fps, using
+    the nearest sampled frame (sample i sits at i * seconds_per_sample in the source).
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video: {video_path}")
+    frame_rate = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    first = int(round(start * frame_rate))
+    last = int(round(end * frame_rate))
+    sample_seconds = seconds_per_sample(frame_rate, keypoint_fps) if keypoint_fps else None
+    cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+
+    proc = subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-y", "-loglevel", "error",
+         "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{frame_rate}", "-i", "pipe:0",
+         "-ss", f"{first / frame_rate:.3f}", "-t", f"{(last - first) / frame_rate:.3f}", "-i", video_path,
+         "-map", "0:v", "-map", "1:a?", "-c:v", "libx264", "-preset", preset, "-crf", str(crf),
+         "-pix_fmt", "yuv420p", "-c:a", "aac", "-shortest", output_path],
+        stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    frames = queue.Queue(maxsize=queue_size)
+    errors = []
+
+    def writer():
+        try:
+            while True:
+                item = frames.get()
+                if item is None:
+                    break
+                frame, t = item
+                label = next((e[2] for e in events if e[0] <= t <= e[1]), None)
+                keypoints = ()
+                if keypoint_cache is not None and sample_seconds:
+                    i = int(round(t / sample_seconds))
+                    if i < keypoint_cache.frames_done:
+                        keypoints = keypoint_cache.get(i)
+                proc.stdin.write(draw_overlay(frame, keypoints, label).tobytes())
+        except Exception as e:  # keep draining so the decoder never blocks on a full queue
+            errors.append(e)
+            while frames.get() is not None:
+                pass
+
+    thread = threading.Thread(target=writer, name="overlay-writer", daemon=True)
+    thread.start()
+    written = 0
+    try:
+        for index in range(first, last):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.put((frame, index / frame_rate))
+            metrics.gauge("overlay_queue", frames.qsize())
+            written += 1
+    finally:
+        frames.put(None)
+        thread.join()
+        cap.release()
+        proc.stdin.close()
+        stderr = proc.stderr.read()
+        proc.wait()
+    if errors:
+        raise errors[0]
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {stderr.decode(errors='ignore').strip()}")
+    metrics.count("overlay_frames", written)
+    return output_path
+
+
+def concat_clips(clip_paths, output_path):
+    """Join clips with the concat demuxer (stream copy); all clips must share codec parameters."""
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        for path in clip_paths:
+            # The concat list quotes paths with '...', so a literal quote is written as '\''
+            quoted = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{quoted}'\n")
+        list_path = f.name
+    try:
+        _run_ffmpeg(["-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", output_path])
+    finally:
+        os.remove(list_path)
+    return output_path
+
+
+def export_highlights(video_path, events, output_dir, overlay=True, keypoint_cache=None, keypoint_fps=None,
+                      pre_roll=2.0, post_roll=2.0, reel=True):
+    """
+    Write one clip per (merged) event window plus an optional highlight reel.
+
+    events are (start, end, label) tuples in source seconds. With overlay=False every
+    clip is a stream copy; with overlay=True each padded window (event plus pre/post
+    roll, so the skeleton is visible going into the fall) is decoded and re-encoded,
+    never the rest of the bout. The rolls are not stream-copied around a re-encoded
+    core: copied segments start on keyframes and keep the source encoder settings,
+    so they could not be joined to libx264 output with a stream-copy concat. Either way
+    all clips share codec parameters, so the reel is a stream-copy concat. Work
+    scales with the total length of the windows, not with the length of the fight.
+    Returns {"clips": [...], "reel": path or None}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video: {video_path}")
+    frame_rate = cap.get(cv2.CAP_PROP_FPS)
+    duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / frame_rate if frame_rate else None
+    cap.release()
+
+    clips = []
+    with metrics.stage("highlights"):
+        for n, (start, end, window_events) in enumerate(merge_windows(events, pre_roll, post_roll, duration)):
+            # Labels come from the LLM; only known ones go into file names
+            labels = "_".join(sorted({e[2] for e in window_events if e[2] in LABEL_COLORS})) or "fall"
+            path = os.path.join(output_dir, f"clip_{n:03d}_{start:07.1f}s_{labels}.mp4")
+            if overlay:
+                render_overlay_clip(video_path, start, end, path, window_events, keypoint_cache, keypoint_fps)
+            else:
+                cut_clip(video_path, start, end, path)
+            clips.append(path)
+        reel_path = None
+        if reel and clips:
+            reel_path = concat_clips(clips, os.path.join(output_dir, "highlights.mp4"))
+    log.info(f"Exported {len(clips)} clip(s) to {output_dir}")
+    return {"clips": clips, "reel": reel_path}
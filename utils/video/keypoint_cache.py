@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+KEYPOINT_CACHE_DIR = "data/cache/keypoints"
+CACHE_VERSION = 2
+NUM_LANDMARKS = 33
+
+
+def hash_source(path, chunk_size=1 << 20):
+    """SHA-256 of a video file, or of every file in a frame directory in name order."""
+    h = hashlib.sha256()
+    if os.path.isdir(path):
+        files = [os.path.join(path, f) for f in sorted(os.listdir(path))]
+    else:
+        files = [path]
+    for file_path in files:
+        h.update(os.path.basename(file_path).encode())
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def source_name(path):
+    """
+    "<stem>-<digest>" for a video file or frame directory, where digest is a short
+    hash of its absolute path: fight1.mp4, frames/fight1 and another card's
+    fight1.mp4 get different names.
+    """
+    path = os.path.abspath(os.path.normpath(path))
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{stem}-{hashlib.sha256(path.encode()).hexdigest()[:10]}"
+
+
+def _source_stamp(path):
+    """Cheap (size, mtime) fingerprint used to avoid re-hashing an unchanged source."""
+    if os.path.isdir(path):
+        entries = [os.stat(os.path.join(path, f)) for f in sorted(os.listdir(path))]
+        return [len(entries), sum(e.st_size for e in entries), max((e.st_mtime_ns for e in entries), default=0)]
+    st = os.stat(path)
+    return [1, st.st_size, st.st_mtime_ns]
+
+
+class KeypointCache:
+    """
+    On-disk store of per-frame pose keypoints for one video.
+
+    Keypoints live in a memory-mapped float32 array of shape (frames, persons, 33, 3)
+    next to a (frames, persons) validity mask, so a finished entry replays without
+    running MediaPipe. The entry is keyed by the video content hash, the sampling fps
+    and the pose model settings; if any of them change the entry is wiped and rebuilt.
+    A partially written entry resumes from the last flushed frame. Entries live
+    under cache_dir/<source_name(source_path)>, one per source path.
+    """
+
+    def __init__(self, source_path, fps, pose_settings, cache_dir=KEYPOINT_CACHE_DIR,
+                 max_persons=4, flush_every=50):
+        self.source_path = source_path
+        self.max_persons = max_persons
+        self.flush_every = flush_every
+        # One entry per source path, so a video and its frame directory or frame store never evict each other
+        self.entry_dir = os.path.join(cache_dir, source_name(source_path))
+        self.meta_path = os.path.join(self.entry_dir, "meta.json")
+        self.keypoints_path = os.path.join(self.entry_dir, "keypoints.npy")
+        self.valid_path = os.path.join(self.entry_dir, "valid.npy")
+
+        meta = self._load_meta()
+        stamp = _source_stamp(source_path)
+        if meta and meta.get("source_stamp") == stamp:
+            source_hash = meta["key"]["source_hash"]
+        else:
+            source_hash = hash_source(source_path)
+
+        self.key = {
+            "version": CACHE_VERSION,
+            "source_hash": source_hash,
+            "fps": float(fps),
+            "pose_settings": dict(sorted(pose_settings.items())),
+            "max_persons": max_persons,
+        }
+        if meta is None or meta.get("key") != self.key:
+            self.invalidate()
+            meta = None
+        self.meta = meta or {"key": self.key, "source_stamp": stamp, "frames_done": 0, "complete": False}
+        self.meta["source_stamp"] = stamp
+        self.keypoints = None
+        self.valid = None
+        if os.path.exists(self.keypoints_path):
+            self.keypoints = np.load(self.keypoints_path, mmap_mode="r+")
+            self.valid = np.load(self.valid_path, mmap_mode="r+")
+        self._unflushed = 0
+
+    @property
+    def frames_done(self):
+        return self.meta["frames_done"]
+
+    @property
+    def complete(self):
+        return self.meta["complete"]
+
+    @property
+    def cuts(self):
+        """Frame indices where the pose engine's cut guard saw a new shot start (empty without a guard)."""
+        return self.meta.get("cuts", [])
+
+    def add_cut(self, frame_index):
+        """Record a cut; it is persisted with the next flush, together with the frames before it."""
+        self.meta.setdefault("cuts", []).append(int(frame_index))
+
+    def _load_meta(self):
+        if not os.path.exists(self.meta_path):
+            return None
+        try:
+            with open(self.meta_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def invalidate(self):
+        """Drop the stored entry (stale key or explicit reset)."""
+        if os.path.isdir(self.entry_dir):
+            shutil.rmtree(self.entry_dir)
+        self.meta = {"key": self.key, "source_stamp": None, "frames_done": 0, "complete": False}
+        self.keypoints = None
+        self.valid = None
+
+    def _ensure_capacity(self, n_frames):
+        capacity = 0 if self.keypoints is None else self.keypoints.shape[0]
+        if n_frames <= capacity:
+            return
+        new_capacity = max(1024, capacity * 2, n_frames)
+        os.makedirs(self.entry_dir, exist_ok=True)
+        tmp_kp = self.keypoints_path + ".tmp.npy"
+        tmp_valid = self.valid_path + ".tmp.npy"
+        keypoints = np.lib.format.open_memmap(
+            tmp_kp, mode="w+", dtype=np.float32, shape=(new_capacity, self.max_persons, NUM_LANDMARKS, 3))
+        valid = np.lib.format.open_memmap(
+            tmp_valid, mode="w+", dtype=np.bool_, shape=(new_capacity, self.max_persons))
+        done = self.frames_done
+        if done:
+            keypoints[:done] = self.keypoints[:done]
+            valid[:done] = self.valid[:done]
+        keypoints.flush()
+        valid.flush()
+        del keypoints, valid
+        self.keypoints = self.valid = None
+        os.replace(tmp_kp, self.keypoints_path)
+        os.replace(tmp_valid, self.valid_path)
+        self.keypoints = np.load(self.keypoints_path, mmap_mode="r+")
+        self.valid = np.load(self.valid_path, mmap_mode="r+")
+
+    def append(self, keypoints_list):
+        """Store the keypoints of the next frame (a list of 33-landmark (x, y, visibility) lists)."""
+        i = self.frames_done
+        self._ensure_capacity(i + 1)
+        self.valid[i] = False
+        for p, kp in enumerate(keypoints_list[:self.max_persons]):
+            self.keypoints[i, p] = kp
+            self.valid[i, p] = True
+        self.meta["frames_done"] = i + 1
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.flush()
+
+    def get(self, i):
+        """Keypoints of frame i as a list of (33, 3) arrays, one per detected person."""
+        kp = self.keypoints[i]
+        return [kp[p] for p in np.flatnonzero(self.valid[i])]
+
+    def replay(self, start=0):
+        """Yield cached keypoints for frames [start, frames_done)."""
+        if self.keypoints is None:
+            return
+        keypoints = np.asarray(self.keypoints[:self.frames_done])
+        valid = np.asarray(self.valid[:self.frames_done])
+        for i in range(start, self.frames_done):
+            yield [keypoints[i, p] for p in np.flatnonzero(valid[i])]
+
+    def flush(self, complete=False):
+        """Persist array data first, then the metadata that marks it as written."""
+        if self.keypoints is not None:
+            self.keypoints.flush()
+            self.valid.flush()
+        if complete:
+            self.meta["complete"] = True
+        os.makedirs(self.entry_dir, exist_ok=True)
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self.meta_path)
+        self._unflushed = 0
@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from utils import instrumentation as metrics
+from utils import backends
+
+log = metrics.get_logger(__name__)
+
+CACHE_DB = "data/cache/llm_cache.sqlite3"
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class LLMCache:
+    """
+    SQLite-backed cache for LLM responses, safe to share between processes.
+
+    Rows are keyed by (hash, model, prompt_version) where hash is hash_text of the
+    prompt input. The database runs in WAL mode so readers never block the single
+    writer, and each put is one INSERT OR REPLACE instead of rewriting a file.
+    Tracks hit/miss counters for this process; with max_entries set, the least
+    recently used rows are evicted every evict_every writes. Hits only record their
+    access time when eviction is on, and those touches are batched into the next put
+    (or close) instead of costing a write per read.
+    """
+
+    def __init__(self, path=CACHE_DB, max_entries=None, evict_every=100):
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._touched = {}  # (key, model, prompt_version) -> last hit time, not yet written
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT NOT NULL, model TEXT NOT NULL, prompt_version INTEGER NOT NULL,"
+            " result TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (key, model, prompt_version))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+        # One row per legacy JSON file already imported, so imports never depend on the table being empty
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache_imports ("
+            " source TEXT PRIMARY KEY, model TEXT NOT NULL, prompt_version INTEGER NOT NULL, imported_at REAL NOT NULL)")
+        self.conn.commit()
+
+    def get(self, key, model, prompt_version):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT result FROM llm_cache WHERE key = ? AND model = ? AND prompt_version = ?",
+                (key, model, prompt_version)).fetchone()
+            if row is None:
+                self.misses += 1
+                metrics.count("llm_cache_misses")
+                return None
+            self.hits += 1
+            metrics.count("llm_cache_hits")
+            if self.max_entries:
+                self._touched[(key, model, prompt_version)] = time.time()
+            return row[0]
+
+    def put(self, key, model, prompt_version, result):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, prompt_version, result, now, now))
+            self._flush_touches()
+            self.conn.commit()
+            self._writes += 1
+            if self.max_entries and self._writes % self.evict_every == 0:
+                self._evict()
+
+    def _flush_touches(self):
+        if self._touched:
+            self.conn.executemany(
+                "UPDATE llm_cache SET accessed_at = ? WHERE key = ? AND model = ? AND prompt_version = ?",
+                [(accessed_at,) + row_key for row_key, accessed_at in self._touched.items()])
+            self._touched = {}
+
+    def _evict(self):
+        self.conn.execute(
+            "DELETE FROM llm_cache WHERE rowid IN (SELECT rowid FROM llm_cache"
+            " ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+        self.conn.commit()
+
+    def import_json(self, json_path, model, prompt_version):
+        """
+        Load a legacy {hash: result} JSON cache once; existing rows win.
+
+        The import is recorded in llm_cache_imports, so later calls (from any
+        process) return 0 without reading the file again.
+        """
+        source = os.path.abspath(json_path)
+        with self._lock:
+            done = self.conn.execute("SELECT 1 FROM llm_cache_imports WHERE source = ?", (source,)).fetchone()
+        if done or not os.path.exists(json_path):
+            return 0
+        with open(json_path, "r") as f:
+            legacy = json.load(f)
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?)",
+                [(key, model, prompt_version, result, now, now) for key, result in legacy.items()])
+            self.conn.execute("INSERT OR REPLACE INTO llm_cache_imports VALUES (?, ?, ?, ?)",
+                              (source, model, prompt_version, now))
+            self.conn.commit()
+        return len(legacy)
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self.conn.commit()
+        self.conn.close()
+
+
+_shared_cache = None
+
+def get_cache():
+    """The process-wide LLMCache on CACHE_DB, opened on first use."""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = LLMCache(CACHE_DB)
+    return _shared_cache
+
+
+def count_usage(usage):
+    metrics.count("llm_calls")
+    if usage:
+        metrics.count("llm_prompt_tokens", usage.prompt_tokens)
+        metrics.count("llm_completion_tokens", usage.completion_tokens)
+
+
+async def _complete(async_client, messages, model, semaphore, retries, backoff, what):
+    for attempt in range(retries + 1):
+        try:
+            async with semaphore:
+                with metrics.stage("llm_call"):
+                    response = await async_client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=0,
+                    )
+            count_usage(response.usage)
+            return response
+        except Exception as e:
+            metrics.count("llm_errors")
+            if attempt == retries:
+                log.error(f"{what} failed after {retries + 1} attempts: {e}")
+                return None
+            # Exponential backoff with jitter so parallel retries do not stampede
+            await asyncio.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+
+
+async def cached_completions(cache, requests, model, prompt_version, concurrency=8, retries=3, backoff=1.0,
+                             async_client=None, what="LLM request"):
+    """
+    Answer {key: messages} chat requests from cache, sending only the misses.
+
+    At most `concurrency` requests are in flight, and failed ones are retried with
+    exponential backoff. A new async client is opened (and closed) unless one is
+    passed. Replies are stored under (key, model, prompt_version). Returns
+    (replies, usage): replies maps key -> content and leaves out requests that failed
+    every attempt; usage is {"calls", "prompt_tokens", "completion_tokens"} for the
+    requests actually sent.
+    """
+    replies = {}
+    pending = {}
+    for key, messages in requests.items():
+        cached = cache.get(key, model, prompt_version)
+        if cached is not None:
+            replies[key] = cached
+        else:
+            pending[key] = messages
+
+    usage = {"calls": len(pending), "prompt_tokens": 0, "completion_tokens": 0}
+    if not pending:
+        return replies, usage
+    own_client = async_client is None
+    if own_client:
+        async_client = backends.openai_async_client()
+    semaphore = asyncio.Semaphore(concurrency)
+    try:
+        responses = await asyncio.gather(*(
+            _complete(async_client, messages, model, semaphore, retries, backoff, what)
+            for messages in pending.values()))
+    finally:
+        if own_client:
+            await async_client.close()
+    for key, response in zip(pending, responses):
+        if response is None:
+            continue
+        if response.usage:
+            usage["prompt_tokens"] += response.usage.prompt_tokens
+            usage["completion_tokens"] += response.usage.completion_tokens
+        content = response.choices[0].message.content
+        cache.put(key, model, prompt_version, content)
+        replies[key] = content
+    return replies, usage
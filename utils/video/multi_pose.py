@@ -0,0 +1,317 @@
+import os
+
+import cv2 as cv
+import numpy as np
+
+from utils import backends
+from utils.video.fighter_tracking import ambiguous_persons
+from utils.video.cut_detection import CutDetector, CUT_DETECTOR_KEYS
+from utils import instrumentation as metrics
+
+log = metrics.get_logger(__name__)
+
+PERSON_PROTOTXT = "models/deploy.prototxt"
+PERSON_WEIGHTS = "models/MobileNetSSD_deploy.caffemodel"
+MOBILENET_SSD_PERSON_CLASS = 15
+
+
+def box_iou(a, b):
+    """IoU between every box in a (n, 4) and b (m, 4), boxes as x1, y1, x2, y2."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+class PersonDetector:
+    """
+    Finds person boxes in a BGR frame.
+
+    Uses an OpenCV DNN MobileNet-SSD (prototxt + caffemodel under models/) when the
+    files load, otherwise falls back to OpenCV's built-in HOG people detector run on
+    a downscaled frame. detect() returns (boxes, scores) with boxes in pixels.
+    """
+
+    def __init__(self, prototxt=PERSON_PROTOTXT, weights=PERSON_WEIGHTS, min_confidence=0.5,
+                 person_class=MOBILENET_SSD_PERSON_CLASS, hog_width=480):
+        self.min_confidence = min_confidence
+        self.person_class = person_class
+        self.hog_width = hog_width
+        self.net = None
+        self.hog = None
+        if os.path.exists(prototxt) and os.path.exists(weights):
+            try:
+                self.net = cv.dnn.readNet(weights, prototxt)
+            except (cv.error, AttributeError) as e:
+                log.info(f"Could not load person detector {weights}: {e}")
+        if self.net is None:
+            self.hog = cv.HOGDescriptor()
+            self.hog.setSVMDetector(cv.HOGDescriptor_getDefaultPeopleDetector())
+
+    def detect(self, frame):
+        h, w = frame.shape[:2]
+        if self.net is not None:
+            blob = cv.dnn.blobFromImage(cv.resize(frame, (300, 300)), 0.007843, (300, 300), 127.5)
+            self.net.setInput(blob)
+            out = self.net.forward().reshape(-1, 7)
+            keep = (out[:, 1] == self.person_class) & (out[:, 2] >= self.min_confidence)
+            boxes = np.clip(out[keep, 3:7], 0.0, 1.0) * np.array([w, h, w, h], dtype=np.float32)
+            return boxes, out[keep, 2]
+
+        scale = min(1.0, self.hog_width / w)
+        small = cv.resize(frame, (int(w * scale), int(h * scale))) if scale < 1.0 else frame
+        rects, weights = self.hog.detectMultiScale(small, winStride=(8, 8), padding=(8, 8), scale=1.1)
+        if len(rects) == 0:
+            return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32)
+        rects = np.asarray(rects, dtype=np.float32) / scale
+        boxes = np.column_stack([rects[:, 0], rects[:, 1], rects[:, 0] + rects[:, 2], rects[:, 1] + rects[:, 3]])
+        return boxes, np.asarray(weights, dtype=np.float32).ravel()
+
+
+class _FighterTrack:
+    __slots__ = ("box", "pose", "heavy_pose", "keypoints", "misses", "upright", "hold", "last_escalated")
+
+    def __init__(self, box, pose):
+        self.box = box
+        self.pose = pose
+        self.heavy_pose = None
+        self.keypoints = None
+        self.misses = 0
+        self.upright = 0  # consecutive upright frames
+        self.hold = 0  # frames left in a candidate fall window
+        self.last_escalated = None
+
+
+class MultiPoseEngine:
+    """
+    Multi-person pose: one person-detector pass, then one MediaPipe tracker per fighter.
+
+    Each tracked fighter box keeps its own static_image_mode=False Pose instance, so
+    tracking state is never shared between people. The detector only reruns every
+    redetect_every frames, when a track loses its pose, or when a fighter moved more
+    than motion_threshold (in normalized frame units) since the last detection;
+    otherwise boxes follow each fighter's own keypoints. process() returns a
+    de-duplicated (persons, 33, 3) float32 array of (x, y, visibility) in full-frame
+    normalized coordinates.
+
+    With a "cascade" entry in pose_settings ({"complexity", "min_visibility",
+    "margin", "hold_frames"}), every crop is first run through the pose_settings
+    model (normally model_complexity=0) and only re-run with the heavier model when
+    the cheap result drops a fighter that was tracked, has low torso visibility, has a hip/shoulder diff
+    near a fall threshold, or falls within hold_frames of the fighter going from
+    upright to grounded (a candidate fall window).
+    The heavy result replaces the cheap one, so box following and everything
+    downstream see a single keypoint set per fighter.
+
+    With a "cut_guard" entry ({"ssim_threshold", "hist_threshold", "width",
+    "steady_threshold", "steady_lag", "skip_frames"}, see
+    cut_detection.cut_guard_settings) every frame first goes
+    through a CutDetector on a small grayscale thumbnail. On a camera cut all
+    fighter tracks (and their MediaPipe state) are dropped and the cut frame (plus
+    the next skip_frames - 1 frames) return no people without running pose, which
+    also closes any open fall group and resets FighterTracker downstream.
+    """
+
+    def __init__(self, pose_settings=None, detector=None, max_persons=2, redetect_every=10,
+                 motion_threshold=0.05, match_iou=0.3, duplicate_iou=0.6, pad=0.15, max_misses=3,
+                 full_frame_fallback=True):
+        self.pose_settings = dict(pose_settings or {})
+        self.cascade = self.pose_settings.pop("cascade", None)
+        self.cut_guard = self.pose_settings.pop("cut_guard", None)
+        self.cut_detector = None
+        if self.cut_guard is not None:
+            self.cut_detector = CutDetector(**{key: self.cut_guard[key] for key in CUT_DETECTOR_KEYS
+                                               if key in self.cut_guard})
+        self.cuts = []  # frame indices where a new shot starts
+        self.skip = 0
+        self.detector = detector or PersonDetector()
+        self.max_persons = max_persons
+        self.redetect_every = redetect_every
+        self.motion_threshold = motion_threshold
+        self.match_iou = match_iou
+        self.duplicate_iou = duplicate_iou
+        self.pad = pad
+        self.max_misses = max_misses
+        self.full_frame_fallback = full_frame_fallback
+        self.tracks = []
+        self.frames_since_detect = None
+        self.needs_detect = True
+        self.pose_inferences = 0
+        self.detections = 0
+        self.frame_index = 0
+        self.escalations = 0
+
+    @property
+    def escalation_rate(self):
+        """Fraction of pose inferences that were re-run with the heavy model."""
+        return self.escalations / self.pose_inferences if self.pose_inferences else 0.0
+
+    def _new_pose(self, complexity=None):
+        settings = dict(self.pose_settings)
+        if complexity is not None:
+            settings["model_complexity"] = complexity
+        return backends.module("mediapipe").solutions.pose.Pose(static_image_mode=False, **settings)
+
+    def _padded(self, box, w, h):
+        x1, y1, x2, y2 = box
+        px, py = (x2 - x1) * self.pad, (y2 - y1) * self.pad
+        return np.array([max(0, x1 - px), max(0, y1 - py), min(w, x2 + px), min(h, y2 + py)], dtype=np.float32)
+
+    def _drop(self, track):
+        track.pose.close()
+        if track.heavy_pose is not None:
+            track.heavy_pose.close()
+        self.tracks.remove(track)
+
+    def _update_tracks_from_detections(self, frame):
+        h, w = frame.shape[:2]
+        with metrics.stage("person_detection"):
+            boxes, scores = self.detector.detect(frame)
+        self.detections += 1
+        metrics.count("person_detections")
+        order = np.argsort(-scores)[:self.max_persons]
+        boxes = boxes[order]
+        if len(boxes) == 0 and not self.tracks and self.full_frame_fallback:
+            boxes = np.array([[0, 0, w, h]], dtype=np.float32)
+
+        # Greedy highest-IoU matching of existing fighter boxes to fresh detections
+        unmatched = list(range(len(boxes)))
+        if self.tracks and len(boxes):
+            iou = box_iou(np.stack([t.box for t in self.tracks]), boxes)
+            matched_tracks = set()
+            for t_idx, b_idx in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+                if iou[t_idx, b_idx] < self.match_iou:
+                    break
+                if b_idx in unmatched and t_idx not in matched_tracks:
+                    self.tracks[t_idx].box = self._padded(boxes[b_idx], w, h)
+                    matched_tracks.add(t_idx)
+                    unmatched.remove(b_idx)
+        for b_idx in unmatched:
+            if len(self.tracks) >= self.max_persons:
+                break
+            self.tracks.append(_FighterTrack(self._padded(boxes[b_idx], w, h), self._new_pose()))
+        self.frames_since_detect = 0
+        self.needs_detect = False
+
+    def _on_cut(self):
+        self.cuts.append(self.frame_index)
+        for track in list(self.tracks):
+            self._drop(track)
+        self.needs_detect = True
+        # The cut frame itself always comes back empty so FighterTracker downstream resets too
+        self.skip = max(self.skip, self.cut_guard.get("skip_frames", 0), 1)
+
+    def process(self, frame):
+        if self.cut_detector is not None:
+            if self.cut_detector.push(frame):
+                self._on_cut()
+            if self.skip > 0:
+                self.skip -= 1
+                self.frame_index += 1
+                metrics.count("cut_skipped_frames")
+                return np.zeros((0, 33, 3), dtype=np.float32)
+        h, w = frame.shape[:2]
+        if self.needs_detect or self.frames_since_detect is None or self.frames_since_detect >= self.redetect_every:
+            self._update_tracks_from_detections(frame)
+        else:
+            self.frames_since_detect += 1
+
+        rgb = cv.cvtColor(frame, cv.COLOR_BGR2RGB)  # one colour conversion per frame, crops are slices
+        scale = np.array([w, h], dtype=np.float32)
+        for track in list(self.tracks):
+            x1, y1, x2, y2 = track.box.astype(int)
+            if x2 - x1 < 16 or y2 - y1 < 16:
+                self._drop(track)
+                continue
+            crop = np.ascontiguousarray(rgb[y1:y2, x1:x2])
+            with metrics.stage("pose_inference"):
+                results = track.pose.process(crop)
+            self.pose_inferences += 1
+            metrics.count("pose_inferences")
+            if self.cascade is not None and self._should_escalate(track, results, (y2 - y1) / h):
+                results = self._escalate(track, crop, results)
+            if not results.pose_landmarks:
+                track.keypoints = None
+                track.misses += 1
+                self.needs_detect = True
+                if track.misses > self.max_misses:
+                    self._drop(track)
+                continue
+            lm = np.array([(l.x, l.y, l.visibility) for l in results.pose_landmarks.landmark], dtype=np.float32)
+            lm[:, 0] = (x1 + lm[:, 0] * (x2 - x1)) / w
+            lm[:, 1] = (y1 + lm[:, 1] * (y2 - y1)) / h
+            track.keypoints = lm
+            track.misses = 0
+
+            # Let the box follow the fighter; a large jump means the detector should look again
+            visible = lm[lm[:, 2] > 0.3, :2]
+            if len(visible):
+                lo, hi = visible.min(axis=0) * scale, visible.max(axis=0) * scale
+                new_box = self._padded(np.concatenate([lo, hi]), w, h)
+                shift = np.linalg.norm((new_box[:2] + new_box[2:] - track.box[:2] - track.box[2:]) / 2 / scale)
+                if shift > self.motion_threshold:
+                    self.needs_detect = True
+                track.box = new_box
+
+        self._drop_duplicates()
+        self.frame_index += 1
+        found = [t.keypoints for t in self.tracks if t.keypoints is not None]
+        metrics.gauge("persons_tracked", len(found))
+        if not found:
+            return np.zeros((0, 33, 3), dtype=np.float32)
+        return np.stack(found)
+
+    def _should_escalate(self, track, results, crop_scale):
+        if not results.pose_landmarks:
+            return track.keypoints is not None  # a fresh dropout, not a track that is already lost
+        lm = np.array([[(l.x, l.y, l.visibility) for l in results.pose_landmarks.landmark]], dtype=np.float64)
+        lm[:, :, 1] *= crop_scale  # crop-normalized y -> frame-normalized, the tracker's units
+        ambiguous, grounded = ambiguous_persons(lm, self.cascade.get("min_visibility", 0.5),
+                                                self.cascade.get("margin", 0.03))
+        hold_frames = self.cascade.get("hold_frames", 3)
+        if grounded[0] and track.upright >= hold_frames:
+            track.hold = hold_frames  # upright for a while, now grounded: a candidate fall starts
+        track.upright = 0 if grounded[0] else track.upright + 1
+        if track.hold > 0:
+            track.hold -= 1
+            return True
+        return bool(ambiguous[0])
+
+    def _escalate(self, track, crop, results):
+        """Re-run one crop with the heavy model; its tracking state is reset after a gap."""
+        if track.heavy_pose is None:
+            track.heavy_pose = self._new_pose(self.cascade.get("complexity", 1))
+        elif track.last_escalated != self.frame_index - 1:
+            track.heavy_pose.reset()
+        track.last_escalated = self.frame_index
+        with metrics.stage("pose_escalation"):
+            heavy = track.heavy_pose.process(crop)
+        self.escalations += 1
+        metrics.count("pose_escalations")
+        return heavy if heavy.pose_landmarks else results
+
+    def _drop_duplicates(self):
+        """Two trackers locked onto the same fighter: keep the one with higher mean visibility."""
+        live = [t for t in self.tracks if t.keypoints is not None]
+        if len(live) < 2:
+            return
+        iou = box_iou(np.stack([t.box for t in live]), np.stack([t.box for t in live]))
+        for i in range(len(live)):
+            for j in range(i + 1, len(live)):
+                if iou[i, j] < self.duplicate_iou:
+                    continue
+                a, b = live[i], live[j]
+                if a not in self.tracks or b not in self.tracks:
+                    continue
+                weaker = a if a.keypoints[:, 2].mean() < b.keypoints[:, 2].mean() else b
+                self._drop(weaker)
+
+    def close(self):
+        for track in list(self.tracks):
+            self._drop(track)
@@ -0,0 +1,94 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from utils.video.multi_pose import MultiPoseEngine
+from utils.video.pose_utils import POSE_SETTINGS, get_multiple_pose_keypoints, detect_fall_intervals_from_keypoints
+from utils.video.video_utils import iter_video_frames, count_sampled_frames, list_frame_files
+from utils import instrumentation as metrics
+
+log = metrics.get_logger(__name__)
+
+
+def _iter_chunk_frames(source, fps, start, stop):
+    """Yield (index, frame) for [start, stop); unreadable frame files are skipped, as in iter_frame_dir."""
+    if isinstance(source, list):
+        for i, path in enumerate(source[start:stop], start=start):
+            frame = cv2.imread(path)
+            if frame is not None:
+                yield i, frame
+    else:
+        yield from enumerate(iter_video_frames(source, fps=fps, start=start, stop=stop), start=start)
+
+
+def _pose_chunk(args):
+    """
+    Worker entry point: run a fresh MultiPoseEngine over [start - warmup, stop).
+
+    Warm-up frames only settle the trackers; their keypoints are discarded so
+    chunk boundaries start from a tracked state. That state is close to, but not
+    the same as, the serial run's: box following and MediaPipe smoothing depend on
+    the whole history, so keypoints after a boundary can differ until the next cut.
+    """
+    source, fps, start, stop, warmup, pose_settings = args
+    first = max(0, start - warmup)
+    engine = MultiPoseEngine(pose_settings)
+    keypoints = []
+    try:
+        for i, frame in _iter_chunk_frames(source, fps, first, stop):
+            kp = get_multiple_pose_keypoints(frame, engine)
+            if i >= start:
+                keypoints.append(kp)
+    finally:
+        engine.close()
+    return keypoints
+
+
+def parallel_pose_keypoints(source, fps=None, workers=None, chunk_size=300, warmup=10,
+                            pose_settings=POSE_SETTINGS):
+    """
+    Multi-person pose keypoints for every frame, computed in a process pool.
+
+    source is a directory of extracted frames or a video path (sampled at fps); a
+    directory is listed and read like iter_frame_dir, so output index i is the same
+    frame as in the serial run.
+    The frame range is cut into chunk_size chunks; each worker process owns its own
+    Pose instances and first runs `warmup` frames of overlap from the previous
+    chunk. Returns the stitched per-frame keypoint lists in frame order.
+    """
+    if os.path.isdir(source):
+        source = list_frame_files(source)
+        n_frames = len(source)
+    else:
+        n_frames = count_sampled_frames(source, fps)
+    workers = workers or os.cpu_count() or 1
+
+    jobs = [(source, fps, start, min(start + chunk_size, n_frames), warmup, pose_settings)
+            for start in range(0, n_frames, chunk_size)]
+    if jobs and not isinstance(source, list):
+        # The container frame count can be off; let the last chunk read to the end of the stream
+        jobs[-1] = jobs[-1][:3] + (None,) + jobs[-1][4:]
+    start_time = time.perf_counter()
+    keypoints = []
+    # Spawned, not forked: a child forked after this process has run MediaPipe inherits its
+    # thread and allocator state and can crash on the first inference
+    context = multiprocessing.get_context("spawn")
+    with metrics.stage("pose_parallel"), ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        for chunk in pool.map(_pose_chunk, jobs):
+            keypoints.extend(chunk)
+    metrics.count("pose_frames", len(keypoints))  # worker processes keep their own counters
+    elapsed = time.perf_counter() - start_time
+    rate = len(keypoints) / elapsed if elapsed > 0 else 0.0
+    log.info(f"Pose on {len(keypoints)} frames with {workers} workers in {elapsed:.2f}s ({rate:.1f} frames/s)")
+    return keypoints
+
+
+def detect_fall_intervals_parallel(source, fps, min_duration=0.3, max_duration=10.0, workers=None,
+                                   chunk_size=300, warmup=10, pose_settings=POSE_SETTINGS):
+    """detect_fall_intervals with pose inference split across worker processes."""
+    keypoints = parallel_pose_keypoints(source, fps, workers=workers, chunk_size=chunk_size, warmup=warmup,
+                                        pose_settings=pose_settings)
+    return detect_fall_intervals_from_keypoints(keypoints, fps, min_duration, max_duration)
@@ -1,45 +1,46 @@
+import copy
+import itertools
 import cv2 as cv
-import mediapipe as mp
 import numpy as np
+from utils.video.multi_pose import MultiPoseEngine
+from utils.video.fighter_tracking import FighterTracker, LEFT_HIP, RIGHT_HIP, LEFT_SHOULDER, RIGHT_SHOULDER
+from utils.video.video_utils import iter_video_frames
+from utils import instrumentation as metrics
+
+log = metrics.get_logger(__name__)
+
+# MediaPipe Pose settings used by detect_fall_intervals; part of the keypoint cache key
+POSE_SETTINGS = {
+    "min_detection_confidence": 0.3,
+    "min_tracking_confidence": 0.3,
+    "model_complexity": 1,
+}
+# Cascade: the lite model on every crop, the full model only where the lite result is
+# ambiguous (see MultiPoseEngine); "complexity": 2 escalates to the heavy model instead
+CASCADE_SETTINGS = {"complexity": 1, "min_visibility": 0.5, "margin": 0.03, "hold_frames": 3}
+CASCADE_POSE_SETTINGS = dict(POSE_SETTINGS, model_complexity=0, cascade=CASCADE_SETTINGS)
 
 def get_pose_keypoints(frame, pose_model):
-    results = pose_model.process(cv.cvtColor(frame, cv.COLOR_BGR2RGB))
+    with metrics.stage("pose_inference"):
+        results = pose_model.process(cv.cvtColor(frame, cv.COLOR_BGR2RGB))
+    metrics.count("pose_inferences")
     if not results.pose_landmarks:
         return None
     return [(lm.x, lm.y, lm.visibility) for lm in results.pose_landmarks.landmark]
 
 def get_multiple_pose_keypoints(frame, pose_model):
-    """Get pose keypoints for multiple people in the frame"""
-    results = pose_model.process(cv.cvtColor(frame, cv.COLOR_BGR2RGB))
-    if not results.pose_landmarks:
-        return []
-    
-    # For now, MediaPipe Pose only detects one person at a time
-    # We'll need to use a different approach for multiple people
-    # Let's try using MediaPipe Pose with different regions of the frame
-    keypoints_list = []
-    
-    # Get the full frame pose
-    full_keypoints = [(lm.x, lm.y, lm.visibility) for lm in results.pose_landmarks.landmark]
-    if full_keypoints:
-        keypoints_list.append(full_keypoints)
-    
-    # Try left half of frame
-    h, w = frame.shape[:2]
-    left_half = frame[:, :w//2]
-    left_results = pose_model.process(cv.cvtColor(left_half, cv.COLOR_BGR2RGB))
-    if left_results.pose_landmarks:
-        left_keypoints = [(lm.x * 0.5, lm.y, lm.visibility) for lm in left_results.pose_landmarks.landmark]
-        keypoints_list.append(left_keypoints)
-    
-    # Try right half of frame
-    right_half = frame[:, w//2:]
-    right_results = pose_model.process(cv.cvtColor(right_half, cv.COLOR_BGR2RGB))
-    if right_results.pose_landmarks:
-        right_keypoints = [(lm.x * 0.5 + 0.5, lm.y, lm.visibility) for lm in right_results.pose_landmarks.landmark]
-        keypoints_list.append(right_keypoints)
-    
-    return keypoints_list
+    """
+    Get pose keypoints for every fighter in the frame.
+
+    pose_model should be a MultiPoseEngine, which runs one person-detector pass and
+    one pose inference per tracked fighter. A bare MediaPipe Pose only sees one
+    person, so it falls back to a single full-frame inference.
+    """
+    metrics.count("pose_frames")
+    if isinstance(pose_model, MultiPoseEngine):
+        return list(pose_model.process(frame))
+    keypoints = get_pose_keypoints(frame, pose_model)
+    return [keypoints] if keypoints is not None else []
 
 def detect_falling_motion_simple(prev_keypoints, curr_keypoints, align_threshold=0.12, drop_threshold=0.10):
     """Detect if hips and shoulders become aligned suddenly (fall event)."""
@@ -47,20 +48,20 @@ def detect_falling_motion_simple(prev_keypoints, curr_keypoints, align_threshold
         return False
     # Shoulders and hips y
     prev_hips_y = np.mean([
-        prev_keypoints[mp.solutions.pose.PoseLandmark.LEFT_HIP.value][1],
-        prev_keypoints[mp.solutions.pose.PoseLandmark.RIGHT_HIP.value][1]
+        prev_keypoints[LEFT_HIP][1],
+        prev_keypoints[RIGHT_HIP][1]
     ])
     prev_shoulders_y = np.mean([
-        prev_keypoints[mp.solutions.pose.PoseLandmark.LEFT_SHOULDER.value][1],
-        prev_keypoints[mp.solutions.pose.PoseLandmark.RIGHT_SHOULDER.value][1]
+        prev_keypoints[LEFT_SHOULDER][1],
+        prev_keypoints[RIGHT_SHOULDER][1]
     ])
     curr_hips_y = np.mean([
-        curr_keypoints[mp.solutions.pose.PoseLandmark.LEFT_HIP.value][1],
-        curr_keypoints[mp.solutions.pose.PoseLandmark.RIGHT_HIP.value][1]
+        curr_keypoints[LEFT_HIP][1],
+        curr_keypoints[RIGHT_HIP][1]
     ])
     curr_shoulders_y = np.mean([
-        curr_keypoints[mp.solutions.pose.PoseLandmark.LEFT_SHOULDER.value][1],
-        curr_keypoints[mp.solutions.pose.PoseLandmark.RIGHT_SHOULDER.value][1]
+        curr_keypoints[LEFT_SHOULDER][1],
+        curr_keypoints[RIGHT_SHOULDER][1]
     ])
     # Difference before and after
     prev_diff = abs(prev_hips_y - prev_shoulders_y)
@@ -82,109 +83,183 @@ def keypoints_center(keypoints):
         return np.array([0.0, 0.0])
     return np.mean(coords, axis=0)
 
-def detect_fall_intervals(frames, fps, min_duration=0.3, max_duration=10.0):
-    mp_pose = mp.solutions.pose
-    pose = mp_pose.Pose(static_image_mode=False, min_detection_confidence=0.3, min_tracking_confidence=0.3)
-    prev_keypoints_list = None
-    window = int(2 * fps)  # 2 seconds window for gradual fall
-    stand_window = int(2 * fps)  # 2 seconds required standing before new fall
-    prev_diffs_list = []  # List of lists: for each person, keep last N diffs
-    stand_counters = []  # For each person, count consecutive standing frames
-    all_events = []
-    current_group = []
-    for i, frame in enumerate(frames):
-        curr_keypoints_list = get_multiple_pose_keypoints(frame, pose)
-        fall_detected = False
-        fall_frame = None
-        if prev_keypoints_list and curr_keypoints_list:
-            # For each person in current frame, find closest in previous frame
-            used_prev = set()
-            new_prev_diffs_list = []
-            new_stand_counters = []
-            for curr_idx, curr_kp in enumerate(curr_keypoints_list):
-                curr_center = keypoints_center(curr_kp)
-                min_dist = float('inf')
-                best_prev = None
-                best_prev_idx = None
-                for j, prev_kp in enumerate(prev_keypoints_list):
-                    if j in used_prev:
-                        continue
-                    prev_center = keypoints_center(prev_kp)
-                    dist = np.linalg.norm(curr_center - prev_center)
-                    if dist < min_dist:
-                        min_dist = dist
-                        best_prev_idx = j
-                        best_prev = prev_kp
-                if best_prev is not None:
-                    used_prev.add(best_prev_idx)
-                    # Compute diffs for gradual detection
-                    prev_diffs = prev_diffs_list[best_prev_idx] if len(prev_diffs_list) > best_prev_idx else []
-                    stand_counter = stand_counters[best_prev_idx] if len(stand_counters) > best_prev_idx else stand_window
-                    curr_hips_y = np.mean([
-                        curr_kp[mp.solutions.pose.PoseLandmark.LEFT_HIP.value][1],
-                        curr_kp[mp.solutions.pose.PoseLandmark.RIGHT_HIP.value][1]
-                    ])
-                    curr_shoulders_y = np.mean([
-                        curr_kp[mp.solutions.pose.PoseLandmark.LEFT_SHOULDER.value][1],
-                        curr_kp[mp.solutions.pose.PoseLandmark.RIGHT_SHOULDER.value][1]
-                    ])
-                    curr_diff = abs(curr_hips_y - curr_shoulders_y)
-                    # Standing logic: if above align_threshold, increment counter; else reset
-                    if curr_diff > 0.08:
-                        stand_counter += 1
-                        if stand_counter > stand_window:
-                            stand_counter = stand_window
-                    else:
-                        stand_counter = 0
-                    # Only allow fall detection if standing for at least stand_window frames
-                    if stand_counter >= stand_window:
-                        if detect_falling_motion_gradual(prev_diffs, curr_diff, window=window):
-                            fall_detected = True
-                            fall_frame = i
-                            stand_counter = 0  # Reset after fall
-                            break
-                    # Update diffs and standing counter for this person
-                    if len(prev_diffs) >= window:
-                        prev_diffs = prev_diffs[1:]
-                    prev_diffs = prev_diffs + [curr_diff]
-                    new_prev_diffs_list.append(prev_diffs)
-                    new_stand_counters.append(stand_counter)
-                else:
-                    new_prev_diffs_list.append([])
-                    new_stand_counters.append(stand_window)
-            prev_diffs_list = new_prev_diffs_list
-            stand_counters = new_stand_counters
-        else:
-            # No previous keypoints, just initialize diffs and standing counters
-            prev_diffs_list = [[] for _ in curr_keypoints_list] if curr_keypoints_list else []
-            stand_counters = [stand_window for _ in curr_keypoints_list] if curr_keypoints_list else []
-        if fall_detected:
-            if not current_group:
-                current_group = [fall_frame]
+def iter_frame_keypoints(frames, keypoint_cache=None, pose_settings=POSE_SETTINGS, fps=None):
+    """
+    Yield get_multiple_pose_keypoints output for each frame.
+
+    With a KeypointCache, frames already stored are replayed instead of running
+    MediaPipe, new frames are appended to it, and a complete entry is replayed
+    without touching frames at all. frames may be None only in that case; otherwise
+    ValueError is raised once the cached frames run out. frames may also be
+    a video path sampled at fps; a resumed run then seeks past the cached frames
+    instead of decoding and discarding them. Cuts found by the cut guard are
+    recorded in the cache (see KeypointCache.cuts) as sampled frame indices.
+    """
+    start = 0
+    if keypoint_cache is not None:
+        yield from keypoint_cache.replay()
+        metrics.count("keypoint_cache_frames", keypoint_cache.frames_done)
+        if keypoint_cache.complete:
+            return
+        start = keypoint_cache.frames_done
+    if frames is None:
+        raise ValueError("frames is required unless a complete keypoint cache is passed"
+                         f" (cached frames: {start})")
+    if isinstance(frames, str):
+        frames = iter_video_frames(frames, fps=fps, start=start)
+    else:
+        frames = itertools.islice(frames, start, None)
+    pose = MultiPoseEngine(pose_settings)
+    pose.frame_index = start
+    try:
+        for frame in frames:
+            n_cuts = len(pose.cuts)
+            keypoints_list = get_multiple_pose_keypoints(frame, pose)
+            if keypoint_cache is not None:
+                for cut in pose.cuts[n_cuts:]:
+                    keypoint_cache.add_cut(cut)
+                keypoint_cache.append(keypoints_list)
+            yield keypoints_list
+        if keypoint_cache is not None:
+            keypoint_cache.flush(complete=True)
+        if pose.cut_guard is not None:
+            log.info(f"Cut guard found {len(pose.cuts)} camera cut(s)")
+        if pose.cascade is not None:
+            log.info(f"Pose cascade escalated {pose.escalations} of {pose.pose_inferences} inferences "
+                     f"({pose.escalation_rate:.0%})")
+    finally:
+        pose.close()
+        if keypoint_cache is not None and not keypoint_cache.complete:
+            keypoint_cache.flush()
+
+def detect_fall_intervals(frames, fps, min_duration=0.3, max_duration=10.0, keypoint_cache=None,
+                          pose_settings=POSE_SETTINGS):
+    """
+    Detect (start, end) fall intervals in seconds.
+
+    frames can be any iterable of BGR frames, including a generator such as
+    video_utils.iter_video_frames, so the whole fight never has to sit in memory.
+    Only the previous frame's keypoints and the per-person diff windows are kept.
+    Pass a KeypointCache to reuse pose keypoints from an earlier run, and
+    CASCADE_POSE_SETTINGS to run the lite/full pose cascade. With instrumentation
+    profiling on, the whole frame loop runs under cProfile.
+    """
+    keypoints_stream = iter_frame_keypoints(frames, keypoint_cache, pose_settings)
+    with metrics.stage("detect_fall_intervals"), metrics.profile("detect_fall_intervals"):
+        return detect_fall_intervals_from_keypoints(keypoints_stream, fps, min_duration, max_duration)
+
+class FallDetector:
+    """
+    Online fall detector: push one frame (or one keypoint set) at a time.
+
+    Keeps the same grouping, stand-window and min/max-duration rules as the batch
+    detect_fall_intervals, but returns each (start, end) interval in seconds from
+    the push call in which its group closes. A group closes on the first frame
+    without a fall, so an interval is emitted max_latency_frames after its last
+    frame. snapshot()/restore() cover the tracking and grouping state, not the
+    MediaPipe trackers used by push_frame.
+    """
+
+    max_latency_frames = 1
+
+    def __init__(self, fps, min_duration=0.3, max_duration=10.0, pose_settings=POSE_SETTINGS):
+        self.fps = fps
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.pose_settings = pose_settings
+        self.window = int(2 * fps)  # 2 seconds window for gradual fall
+        self.stand_window = int(2 * fps)  # 2 seconds required standing before new fall
+        self.tracker = FighterTracker(self.window, self.stand_window)
+        self.frame_index = 0
+        self.current_group = None  # [first_fall_frame, last_fall_frame] of the open group
+        self.pose = None
+
+    def _close_group(self):
+        start_idx, end_idx = self.current_group
+        self.current_group = None
+        duration = (end_idx - start_idx + 1) / self.fps
+        if self.min_duration <= duration <= self.max_duration:
+            return [(start_idx / self.fps, end_idx / self.fps)]
+        return []
+
+    def push_keypoints(self, keypoints_list):
+        """Advance one frame with its multi-person keypoints; returns intervals closed by it."""
+        i = self.frame_index
+        self.frame_index += 1
+        emitted = []
+        fell = self.tracker.update(keypoints_list)
+        metrics.count("frames_tracked")
+        metrics.gauge("fighter_tracks", len(self.tracker.tracks))
+        if fell:
+            metrics.count("fall_frames")
+            if self.current_group is None:
+                self.current_group = [i, i]
+            elif i - self.current_group[1] <= self.stand_window:
+                # A new fall within the standing window after the previous one extends the interval
+                self.current_group[1] = i
             else:
-                # If a new fall is detected within the standing window after a previous fall, extend the interval
-                if fall_frame - current_group[-1] <= stand_window:
-                    current_group.append(fall_frame)
-                else:
-                    # Otherwise, finalize the previous group and start a new one
-                    start_idx, end_idx = current_group[0], current_group[-1]
-                    duration = (end_idx - start_idx + 1) / fps
-                    if min_duration <= duration <= max_duration:
-                        all_events.append((start_idx / fps, end_idx / fps))
-                    current_group = [fall_frame]
-        else:
-            if current_group:
-                start_idx, end_idx = current_group[0], current_group[-1]
-                duration = (end_idx - start_idx + 1) / fps
-                if min_duration <= duration <= max_duration:
-                    all_events.append((start_idx / fps, end_idx / fps))
-                current_group = []
-        prev_keypoints_list = curr_keypoints_list
-    pose.close()
-    # Finalize last group if any
-    if current_group:
-        start_idx, end_idx = current_group[0], current_group[-1]
-        duration = (end_idx - start_idx + 1) / fps
-        if min_duration <= duration <= max_duration:
-            all_events.append((start_idx / fps, end_idx / fps))
-    return all_events
+                emitted = self._close_group()
+                self.current_group = [i, i]
+        elif self.current_group is not None:
+            emitted = self._close_group()
+        return emitted
+
+    def push_frame(self, frame):
+        """Run pose on one BGR frame and advance; returns intervals closed by it."""
+        if self.pose is None:
+            self.pose = MultiPoseEngine(self.pose_settings)
+        return self.push_keypoints(get_multiple_pose_keypoints(frame, self.pose))
+
+    def flush(self):
+        """End of stream: close the open group, if any."""
+        return self._close_group() if self.current_group is not None else []
+
+    def cut(self):
+        """Camera cut before the next frame: close the open group and forget every fighter track."""
+        self.tracker.tracks = []
+        return self.flush()
+
+    def snapshot(self):
+        return copy.deepcopy({
+            "frame_index": self.frame_index,
+            "current_group": self.current_group,
+            "tracks": self.tracker.tracks,
+        })
+
+    def restore(self, state):
+        state = copy.deepcopy(state)
+        self.frame_index = state["frame_index"]
+        self.current_group = state["current_group"]
+        self.tracker.tracks = state["tracks"]
+
+    def close(self):
+        if self.pose is not None:
+            self.pose.close()
+            self.pose = None
+
+def iter_fall_intervals(keypoints_stream, fps, min_duration=0.3, max_duration=10.0, cuts=(), skip_frames=0):
+    """
+    Yield each fall interval as soon as its group closes.
+
+    cuts are frame indices where a new shot starts (e.g. from a cut_detection shot
+    index): the detector is cut there and the cut frame plus the next
+    skip_frames - 1 frames are treated as empty, as the cut guard would have done
+    (the cut frame itself is always empty, even with skip_frames=0).
+    """
+    detector = FallDetector(fps, min_duration, max_duration)
+    cuts = set(cuts)
+    skip = 0
+    for i, keypoints_list in enumerate(keypoints_stream):
+        if i in cuts:
+            yield from detector.cut()
+            skip = max(skip, skip_frames, 1)
+        if skip > 0:
+            skip -= 1
+            keypoints_list = []
+        yield from detector.push_keypoints(keypoints_list)
+    yield from detector.flush()
+
+def detect_fall_intervals_from_keypoints(keypoints_stream, fps, min_duration=0.3, max_duration=10.0, cuts=(),
+                                         skip_frames=0):
+    """Group fall detections over a per-frame stream of multi-person keypoints."""
+    return list(iter_fall_intervals(keypoints_stream, fps, min_duration, max_duration, cuts, skip_frames))
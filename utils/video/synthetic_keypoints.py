@@ -0,0 +1,70 @@
+import numpy as np
+
+# Rough standing pose in normalized image coordinates: y of each of the 33 MediaPipe
+# landmarks relative to the hip line, for a fighter about 0.5 of the frame tall.
+_STANDING_Y = np.array(
+    [-0.42] * 11 +          # face
+    [-0.25, -0.25,          # shoulders
+     -0.12, -0.12,          # elbows
+     -0.02, -0.02,          # wrists
+     0.0, 0.0, 0.0, 0.0, 0.0, 0.0,  # hands
+     0.0, 0.0,              # hips
+     0.18, 0.18,            # knees
+     0.34, 0.34,            # ankles
+     0.37, 0.37, 0.36, 0.36])  # heels, toes
+
+
+def _person(cx, hip_y, torso_scale, rng, jitter):
+    kp = np.empty((33, 3), dtype=np.float32)
+    kp[:, 0] = cx + rng.normal(0, 0.04, 33)
+    kp[:, 1] = hip_y + _STANDING_Y * torso_scale + rng.normal(0, jitter, 33)
+    kp[:, 2] = rng.uniform(0.5, 1.0, 33)
+    return kp
+
+
+def generate_keypoint_sequence(n_frames, fps, n_persons=2, fall_every=60.0, fall_duration=(1.0, 4.0),
+                               jitter=0.005, dropout=0.02, seed=0):
+    """
+    Synthetic multi-person keypoint stream for benchmarking and tuning without MediaPipe.
+
+    Fighters drift around the frame standing upright (shoulder/hip diff ~0.25).
+    Roughly every fall_every seconds one of them falls: the torso tips over
+    in ~0.4 s and stays grounded (diff near 0) for a random fall_duration, then they
+    get back up. dropout is the per-person chance of a missed detection in a frame.
+    Returns (stream, truth): a generator of per-frame lists of (33, 3) arrays, and
+    the list of ground-truth (start, end) fall intervals in seconds.
+    """
+    rng = np.random.default_rng(seed)
+    fall_frames = []
+    t = rng.exponential(fall_every) * fps
+    while t < n_frames:
+        length = int(rng.uniform(*fall_duration) * fps)
+        fall_frames.append((int(t), int(t) + length, int(rng.integers(n_persons))))
+        t += length + rng.exponential(fall_every) * fps + 3 * fps
+    truth = [(start / fps, min(end, n_frames - 1) / fps) for start, end, _ in fall_frames]
+
+    def stream():
+        frame_rng = np.random.default_rng(seed + 1)
+        centers = np.linspace(0.3, 0.7, n_persons)
+        tip_frames = max(1, int(0.4 * fps))
+        k = 0
+        for i in range(n_frames):
+            while k < len(fall_frames) and i > fall_frames[k][1] + tip_frames:
+                k += 1
+            centers = np.clip(centers + frame_rng.normal(0, 0.004, n_persons), 0.1, 0.9)
+            people = []
+            for p in range(n_persons):
+                scale = 1.0
+                if k < len(fall_frames) and fall_frames[k][2] == p:
+                    start, end, _ = fall_frames[k]
+                    if start <= i <= end:
+                        scale = max(0.05, 1.0 - (i - start + 1) / tip_frames)
+                    elif end < i <= end + tip_frames:
+                        scale = (i - end) / tip_frames
+                if frame_rng.random() < dropout:
+                    continue
+                people.append(_person(centers[p], 0.6 + 0.1 * (1 - scale), scale, frame_rng, jitter))
+            yield people
+
+    return stream(), truth
+
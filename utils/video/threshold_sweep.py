@@ -0,0 +1,306 @@
+import itertools
+import json
+import os
+
+import numpy as np
+
+from utils import backends
+from utils.video.fighter_tracking import as_keypoint_array, frame_metrics
+from utils import instrumentation as metrics
+
+log = metrics.get_logger(__name__)
+
+# Default grid: thresholds on the shoulder/hip y difference, windows and durations in seconds
+DEFAULT_GRID = {
+    "align_threshold": np.arange(0.04, 0.161, 0.02),
+    "drop_threshold": np.arange(0.05, 0.251, 0.025),
+    "stand_threshold": np.arange(0.04, 0.141, 0.02),
+    "window": [0.5, 1.0, 2.0, 3.0],
+    "stand_window": [0.5, 1.0, 2.0, 3.0],
+    "min_duration": [0.2, 0.3, 0.5, 1.0],
+    "max_duration": [5.0, 10.0, 20.0],
+}
+FRAME_PARAMS = ("align_threshold", "drop_threshold", "stand_threshold", "window", "stand_window")
+
+
+class TrackSeries:
+    """
+    Config-independent part of the fall heuristic, extracted once per fight.
+
+    diffs[f, p] is person p's |shoulder y - hip y| in frame f (NaN past counts[f]),
+    assigned[f, p] is the index of the person in frame f - 1 it continues (-1 for a
+    fresh track), and evaluated[f] is False where FighterTracker only starts tracks
+    (first frame, or the frame after an empty one). Track centres do not depend on
+    the thresholds, so this matching is the same for every config.
+    """
+
+    def __init__(self, diffs, assigned, counts, evaluated, fps):
+        self.diffs = diffs
+        self.assigned = assigned
+        self.counts = counts
+        self.evaluated = evaluated
+        self.fps = fps
+
+    @classmethod
+    def from_keypoints(cls, keypoints_stream, fps):
+        rows = []
+        prev_centers = None
+        for keypoints_list in keypoints_stream:
+            keypoints = as_keypoint_array(keypoints_list)
+            if len(keypoints) == 0:
+                rows.append((np.zeros(0), np.zeros(0, dtype=int), False))
+                prev_centers = None
+                continue
+            diffs, centers = frame_metrics(keypoints)
+            assigned = np.full(len(centers), -1)
+            if prev_centers is not None:
+                dist = np.linalg.norm(centers[:, None, :] - prev_centers[None, :, :], axis=2)
+                r, c = backends.module("scipy.optimize").linear_sum_assignment(dist)
+                assigned[r] = c
+            rows.append((diffs, assigned, prev_centers is not None))
+            prev_centers = centers
+
+        width = max((len(d) for d, _, _ in rows), default=0)
+        n = len(rows)
+        diffs = np.full((n, width), np.nan)
+        assigned = np.full((n, width), -1)
+        counts = np.zeros(n, dtype=int)
+        evaluated = np.zeros(n, dtype=bool)
+        for f, (d, a, e) in enumerate(rows):
+            diffs[f, :len(d)] = d
+            assigned[f, :len(a)] = a
+            counts[f] = len(d)
+            evaluated[f] = e
+        return cls(diffs, assigned, counts, evaluated, fps)
+
+    def save(self, path):
+        np.savez_compressed(path, diffs=self.diffs, assigned=self.assigned, counts=self.counts,
+                            evaluated=self.evaluated, fps=self.fps)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(data["diffs"], data["assigned"], data["counts"], data["evaluated"], float(data["fps"]))
+
+
+def fall_frames(series, align_threshold, drop_threshold, stand_threshold, window, stand_window):
+    """
+    Per-frame fall flags for C configs at once: returns a (C, frames) bool array.
+
+    Parameters are length-C arrays; window and stand_window are in frames (stand_window
+    >= 1). Runs one pass over the frames with (C, persons) state arrays and reproduces
+    FighterTracker.update exactly: a track's ring of diffs is reduced to the number of
+    pushes since its last diff above align_threshold.
+    """
+    align, drop, stand = (np.asarray(x, dtype=np.float64) for x in (align_threshold, drop_threshold, stand_threshold))
+    window = np.asarray(window, dtype=np.float64)
+    stand_window = np.asarray(stand_window, dtype=np.float64)
+    n_configs = len(align)
+    falls = np.zeros((n_configs, len(series.diffs)), dtype=bool)
+    stand_counter = age = np.zeros((n_configs, 0))
+    for f in range(len(series.diffs)):
+        n = series.counts[f]
+        new_counter = np.empty((n_configs, n))
+        new_age = np.empty((n_configs, n))
+        new_counter[:] = stand_window[:, None]
+        new_age[:] = np.inf
+        if series.evaluated[f]:
+            fell = np.zeros(n_configs, dtype=bool)
+            for p in range(n):
+                t = series.assigned[f, p]
+                if t < 0:
+                    continue
+                diff = series.diffs[f, p]
+                counter = np.where(diff > stand, np.minimum(stand_counter[:, t] + 1, stand_window), 0.0)
+                fall_now = ~fell & (counter >= stand_window) & (age[:, t] < window) & (diff < drop)
+                fresh = fell | fall_now
+                pushed_age = np.where(diff > align, 0.0, age[:, t] + 1)
+                new_counter[:, p] = np.where(fresh, stand_window, counter)
+                new_age[:, p] = np.where(fresh, np.inf, pushed_age)
+                fell |= fall_now
+            falls[:, f] = fell
+        stand_counter, age = new_counter, new_age
+    return falls
+
+
+def fall_runs(falls):
+    """Runs of consecutive fall frames per config: (config, start_frame, stop_frame) arrays, stop exclusive."""
+    padded = np.zeros((falls.shape[0], falls.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = falls
+    edges = np.diff(padded, axis=1)
+    cfg, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
+    return cfg, starts, stops
+
+
+def load_intervals(path):
+    """
+    Ground-truth (start, end) intervals in seconds, sorted with overlaps merged.
+
+    Accepts JSON (a list of [start, end] pairs or of {start_time, end_time} dicts, or an
+    exported annotations file with "events") or a text/CSV file with "start,end" lines.
+    """
+    intervals = []
+    if path.endswith(".json"):
+        with open(path, "r") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get("events", data.get("intervals", []))
+        for item in data:
+            if isinstance(item, dict):
+                intervals.append((float(item.get("start_time", item.get("start"))),
+                                  float(item.get("end_time", item.get("end")))))
+            else:
+                intervals.append((float(item[0]), float(item[1])))
+    else:
+        with open(path, "r") as f:
+            for line in f:
+                parts = line.replace(",", " ").split()
+                try:
+                    intervals.append((float(parts[0]), float(parts[1])))
+                except (IndexError, ValueError):
+                    continue  # header or blank line
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return np.asarray(merged, dtype=np.float64).reshape(-1, 2)
+
+
+def score_intervals(cfg, start_s, end_s, n_configs, truth, tolerance=0.5):
+    """
+    Precision/recall for many configs from one flat list of predicted intervals.
+
+    cfg[k] is the config of predicted interval k. A prediction is a true positive if
+    it overlaps a ground-truth interval (both widened by tolerance seconds); a truth
+    interval is recalled if any prediction of that config overlaps it. Both sides are
+    resolved with searchsorted against the sorted truth, with no per-config loop.
+    """
+    n_pred = np.bincount(cfg, minlength=n_configs)
+    n_truth = len(truth)
+    if n_truth == 0:
+        tp = np.zeros(n_configs)
+        recalled = np.zeros(n_configs)
+    else:
+        t_start, t_end = truth[:, 0], truth[:, 1]
+        last = np.searchsorted(t_start, end_s + tolerance, side="right") - 1
+        hit = (last >= 0) & (t_end[np.maximum(last, 0)] >= start_s - tolerance)
+        tp = np.bincount(cfg, weights=hit, minlength=n_configs)
+        first = np.searchsorted(t_end, start_s - tolerance, side="left")
+        spans = first <= last  # the truth intervals [first, last] overlap prediction k
+        coverage = np.zeros((n_configs, n_truth + 1), dtype=np.int32)
+        np.add.at(coverage, (cfg[spans], first[spans]), 1)
+        np.add.at(coverage, (cfg[spans], last[spans] + 1), -1)
+        recalled = (np.cumsum(coverage, axis=1)[:, :n_truth] > 0).sum(axis=1)
+    precision = np.divide(tp, n_pred, out=np.zeros(n_configs), where=n_pred > 0)
+    recall = recalled / n_truth if n_truth else np.zeros(n_configs)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(n_configs),
+                   where=precision + recall > 0)
+    return {"predicted": n_pred, "true_positives": tp, "recalled": recalled,
+            "precision": precision, "recall": recall, "f1": f1}
+
+
+def sweep(series, truth, grid=None, tolerance=0.5, chunk_size=2048):
+    """
+    Score every combination in grid (see DEFAULT_GRID) against truth intervals.
+
+    The five per-frame parameters share one vectorized pass over the frames per chunk
+    of configs; min/max duration only filter the resulting runs, so they are applied
+    by broadcasting. Returns a dict of equal-length arrays, one entry per config.
+    """
+    grid = {**DEFAULT_GRID, **(grid or {})}
+    fps = series.fps
+    frame_grid = np.array(list(itertools.product(*(grid[name] for name in FRAME_PARAMS))), dtype=np.float64)
+    frame_grid[:, 3] = np.floor(frame_grid[:, 3] * fps)
+    frame_grid[:, 4] = np.maximum(1, np.floor(frame_grid[:, 4] * fps))
+    frame_grid = np.unique(frame_grid, axis=0)
+    durations = np.array([(lo, hi) for lo, hi in itertools.product(grid["min_duration"], grid["max_duration"])
+                          if lo <= hi], dtype=np.float64).reshape(-1, 2)
+    n_dur = len(durations)
+
+    results = []
+    for offset in range(0, len(frame_grid), chunk_size):
+        chunk = frame_grid[offset:offset + chunk_size]
+        with metrics.stage("sweep_frames"):
+            falls = fall_frames(series, *chunk.T)
+        run_cfg, starts, stops = fall_runs(falls)
+        seconds = (stops - starts) / fps  # FallDetector: (end - start + 1) / fps
+        keep = (seconds[:, None] >= durations[None, :, 0]) & (seconds[:, None] <= durations[None, :, 1])
+        run_idx, dur_idx = np.nonzero(keep)
+        cfg = run_cfg[run_idx] * n_dur + dur_idx
+        scores = score_intervals(cfg, starts[run_idx] / fps, (stops[run_idx] - 1) / fps,
+                                 len(chunk) * n_dur, truth, tolerance)
+        params = np.repeat(chunk, n_dur, axis=0)
+        scores.update({name: params[:, i] for i, name in enumerate(FRAME_PARAMS)})
+        scores["window"] = scores["window"] / fps
+        scores["stand_window"] = scores["stand_window"] / fps
+        scores["min_duration"] = np.tile(durations[:, 0], len(chunk))
+        scores["max_duration"] = np.tile(durations[:, 1], len(chunk))
+        results.append(scores)
+    return {key: np.concatenate([r[key] for r in results]) for key in results[0]}
+
+
+def top_configs(results, k=10, key="f1"):
+    """The k best configs as dicts, ranked by key, then precision, then recall."""
+    order = np.lexsort((-results["recall"], -results["precision"], -results[key]))[:k]
+    return [{name: float(values[i]) for name, values in results.items()} for i in order]
+
+
+def series_for_source(source, fps, series_path=None):
+    """Build (or load) the TrackSeries of a video or frame directory, running pose at most once via KeypointCache."""
+    if series_path and os.path.exists(series_path):
+        return TrackSeries.load(series_path)
+    from utils.video.keypoint_cache import KeypointCache
+    from utils.video.pose_utils import POSE_SETTINGS, iter_frame_keypoints
+    from utils.video.video_utils import iter_frame_dir
+    cache = KeypointCache(source, fps, POSE_SETTINGS)
+    frames = iter_frame_dir(source) if os.path.isdir(source) else source
+    series = TrackSeries.from_keypoints(iter_frame_keypoints(frames, cache, POSE_SETTINGS, fps), fps)
+    if series_path:
+        series.save(series_path)
+    return series
+
+
+def _parse_values(spec):
+    """"0.04:0.16:0.02" (inclusive range) or "0.5,1,2"."""
+    if ":" in spec:
+        lo, hi, step = (float(x) for x in spec.split(":"))
+        return np.arange(lo, hi + step / 2, step)
+    return [float(x) for x in spec.split(",")]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Grid-search the fall heuristic thresholds against labeled intervals")
+    parser.add_argument("source", help="Video file or directory of extracted frames")
+    parser.add_argument("--truth", required=True, help="Ground-truth intervals (.json or start,end lines)")
+    parser.add_argument("--fps", type=float, default=5)
+    parser.add_argument("--series", default=None, help="Save/load the extracted track series (.npz)")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Seconds of slack when matching intervals")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", default=None, help="Write all scored configs to this JSON file")
+    for name in DEFAULT_GRID:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=_parse_values, default=None,
+                            help="Values as lo:hi:step or a,b,c" + (" (seconds)" if "window" in name or "duration" in name else ""))
+    args = parser.parse_args()
+
+    series = series_for_source(args.source, args.fps, args.series)
+    truth = load_intervals(args.truth)
+    grid = {name: getattr(args, name) for name in DEFAULT_GRID if getattr(args, name) is not None}
+    started = time.perf_counter()
+    results = sweep(series, truth, grid, args.tolerance)
+    elapsed = time.perf_counter() - started
+    log.info(f"Scored {len(results['f1'])} configs on {len(series.diffs)} frames against "
+             f"{len(truth)} true intervals in {elapsed:.2f}s")
+    for rank, cfg in enumerate(top_configs(results, args.top), 1):
+        print(f"{rank:>3}. F1 {cfg['f1']:.3f}  P {cfg['precision']:.3f}  R {cfg['recall']:.3f}  "
+              f"({int(cfg['predicted'])} predicted)  align {cfg['align_threshold']:.3f}  "
+              f"drop {cfg['drop_threshold']:.3f}  stand {cfg['stand_threshold']:.3f}  "
+              f"window {cfg['window']:.1f}s  stand_window {cfg['stand_window']:.1f}s  "
+              f"duration {cfg['min_duration']:.1f}-{cfg['max_duration']:.1f}s")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({key: values.tolist() for key, values in results.items()}, f)
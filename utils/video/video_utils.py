@@ -1,44 +1,179 @@
 import cv2
 import os
-import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from utils.audio.audio_utils import extract_audio_from_video
+from utils import instrumentation as metrics
+
+log = metrics.get_logger(__name__)
 
 def get_video_name(path):
     return os.path.splitext(os.path.basename(path))[0]
 
-def extract_frames(video_path, output_dir, fps=1):
+def frame_step(frame_rate, fps):
+    """Number of source frames between two sampled frames (at least 1)."""
+    return max(1, round(frame_rate / fps))
+
+def seconds_per_sample(frame_rate, fps):
+    """Source seconds between two sampled frames: sample i sits at i * seconds_per_sample, not i / fps."""
+    return frame_step(frame_rate, fps) / frame_rate if frame_rate else 1.0 / fps
+
+def video_seconds_per_sample(video_path, fps):
+    """seconds_per_sample for a video file's own frame rate."""
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         raise IOError(f"Could not open video: {video_path}")
-
     frame_rate = cap.get(cv2.CAP_PROP_FPS)
-    count = 0
-    saved = 0
+    cap.release()
+    return seconds_per_sample(frame_rate, fps)
+
+def _iter_sampled(cap, step, start=0, stop=None):
+    """
+    Yield (sample_index, frame) for every step-th source frame in [start, stop).
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
+    Dropped frames are only grabbed, never retrieved, so they are not fully
+    decoded into BGR images. start must be a multiple of step so that sample
+    numbering matches a read from the beginning of the video.
+    """
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    count = start
+    while stop is None or count < stop:
+        if not cap.grab():
             break
-        if int(count % round(frame_rate / fps)) == 0:
-            filename = os.path.join(output_dir, f"frame_{saved:04d}.jpg")
-            filename = filename.replace('\\', '/')
-            print(filename, "saved")
-            cv2.imwrite(filename, frame)
-            saved += 1
+        if count % step == 0:
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            metrics.count("frames_decoded")
+            yield count // step, frame
         count += 1
 
+def _frame_filename(output_dir, index, ext):
+    return os.path.join(output_dir, f"frame_{index:04d}.{ext}").replace('\\', '/')
+
+def count_sampled_frames(video_path, fps=1):
+    """Number of frames iter_video_frames/extract_frames will produce (from the container frame count)."""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video: {video_path}")
+    step = frame_step(cap.get(cv2.CAP_PROP_FPS), fps)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     cap.release()
+    return -(-total // step)
+
+def iter_video_frames(video_path, fps=1, output_dir=None, start=0, stop=None, every=1):
+    """
+    Yield sampled BGR frames straight from cv2.VideoCapture at the target fps.
 
-def extract_audio(video_path, output_path):
-    command = [
-        "ffmpeg",
-        "-i", video_path,
-        "-vn",  # no video
-        "-acodec", "pcm_s16le",
-        "-ar", "44100",
-        "-ac", "2",
-        output_path
-    ]
+    Only one decoded frame is alive at a time, so memory stays bounded no matter
+    how long the video is. If output_dir is given, each yielded frame is also saved
+    as frame_NNNN.jpg with the same numbering extract_frames uses. start/stop select
+    a range of sampled frame indices. every > 1 keeps only the sampled indices that
+    are multiples of every, on the same source-frame grid as a full read at fps.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video: {video_path}")
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    step = frame_step(cap.get(cv2.CAP_PROP_FPS), fps)
+    start = -(-start // every) * every
     try:
-        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-    except subprocess.CalledProcessError:
-        raise RuntimeError(f"Audio extraction failed for: {video_path}")
\ No newline at end of file
+        for j, frame in _iter_sampled(cap, step * every, start * step, None if stop is None else stop * step):
+            index = j * every
+            if output_dir:
+                cv2.imwrite(_frame_filename(output_dir, index, "jpg"), frame)
+            yield frame
+    finally:
+        cap.release()
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+def list_frame_files(frames_dir):
+    """Paths of the image files in a frame directory, in filename order."""
+    return [os.path.join(frames_dir, f) for f in sorted(os.listdir(frames_dir))
+            if f.lower().endswith(IMAGE_EXTENSIONS)]
+
+def iter_frame_dir(frames_dir):
+    """Yield frames from a directory of extracted JPEGs one at a time, in filename order; unreadable files are skipped."""
+    for path in list_frame_files(frames_dir):
+        frame = cv2.imread(path)
+        if frame is not None:
+            yield frame
+
+def _write_sampled(cap, step, output_dir, ext, writer_threads, start=0, stop=None):
+    """Decode sampled frames on this thread and encode/write them on a thread pool."""
+    max_pending = writer_threads * 4  # bounds how many decoded frames wait for the encoder
+    pending = set()
+    saved = 0
+    with ThreadPoolExecutor(max_workers=writer_threads) as pool:
+        for index, frame in _iter_sampled(cap, step, start, stop):
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    fut.result()
+            pending.add(pool.submit(cv2.imwrite, _frame_filename(output_dir, index, ext), frame))
+            metrics.gauge("frame_writer_queue", len(pending))
+            saved += 1
+        for fut in pending:
+            fut.result()
+    return saved
+
+def _extract_segment(args):
+    """Worker entry point: extract the sampled frames of one [start, stop) segment."""
+    video_path, output_dir, step, ext, writer_threads, start, stop = args
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video: {video_path}")
+    try:
+        return _write_sampled(cap, step, output_dir, ext, writer_threads, start, stop)
+    finally:
+        cap.release()
+
+def extract_frames(video_path, output_dir, fps=1, ext="jpg", workers=1, writer_threads=4):
+    """
+    Save every sampled frame of video_path to output_dir/frame_NNNN.<ext>.
+
+    Frames that are not kept are grabbed but not decoded, and image encoding runs on
+    a pool of writer_threads. With workers > 1 the video is split into time segments
+    that are decoded in parallel processes; segment boundaries are aligned to the
+    sampling step so file numbering is identical to the single-process output.
+    Returns the number of frames saved.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video: {video_path}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    step = frame_step(cap.get(cv2.CAP_PROP_FPS), fps)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    start_time = time.perf_counter()
+
+    with metrics.stage("extract_frames"):
+        if workers > 1 and total > step * workers:
+            cap.release()
+            # Segment boundaries are multiples of step; the last segment reads to the end of the
+            # stream in case CAP_PROP_FRAME_COUNT is an underestimate
+            seg_len = -(-total // (workers * step)) * step
+            bounds = [(s, s + seg_len) for s in range(0, total, seg_len)]
+            bounds[-1] = (bounds[-1][0], None)
+            jobs = [(video_path, output_dir, step, ext, writer_threads, s, e) for s, e in bounds]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                saved = sum(pool.map(_extract_segment, jobs))
+            metrics.count("frames_decoded", saved)  # worker processes keep their own counters
+        else:
+            try:
+                saved = _write_sampled(cap, step, output_dir, ext, writer_threads)
+            finally:
+                cap.release()
+
+    elapsed = time.perf_counter() - start_time
+    rate = saved / elapsed if elapsed > 0 else 0.0
+    log.info(f"Extracted {saved} frames to {output_dir} in {elapsed:.2f}s ({rate:.1f} frames/s)")
+    return saved
+
+def extract_audio(video_path, output_path, sr=44100, channels=2):
+    """Write a WAV copy of the audio track. The pipeline itself reads PCM in memory via audio_utils.load_audio_pcm."""
+    return extract_audio_from_video(video_path, output_path, sr=sr, channels=channels)
@@ -1,23 +1,21 @@
 import os
-import cv2
-from utils.video.video_utils import extract_frames, get_video_name
-from utils.video.pose_utils import detect_fall_intervals
+from utils.video.video_utils import iter_video_frames, get_video_name
+from utils.video.pose_utils import detect_fall_intervals, POSE_SETTINGS
+from utils.video.keypoint_cache import KeypointCache
 from utils.video.event_summarizer import summarize_event_for_llm
 from utils.video.fall_classifier import classify_fall_event_with_llm
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 VIDEO_PATH = "data/raw_data/fight1.mp4"
 FRAMES_DIR = f"data/frames/{get_video_name(VIDEO_PATH)}"
-FPS = 5  # Must match your extract_frames FPS
+FPS = 5  # Sampling rate used for detection
+SAVE_FRAMES = False  # Set True to also write frame_NNNN.jpg files to FRAMES_DIR
 print(VIDEO_PATH, FRAMES_DIR)
-# Step 1: Extract frames
-extract_frames(VIDEO_PATH, FRAMES_DIR, fps=FPS)
+# Step 1 + 2: Stream sampled frames straight from the video (optionally saving JPEGs)
+frames = iter_video_frames(VIDEO_PATH, fps=FPS, output_dir=FRAMES_DIR if SAVE_FRAMES else None)
 
-# Step 2: Load frames into memory
-frame_files = sorted(os.listdir(FRAMES_DIR))
-frames = [cv2.imread(os.path.join(FRAMES_DIR, f)) for f in frame_files]
-
-# Step 3: Detect fall intervals
-fall_intervals = detect_fall_intervals(frames, fps=FPS)
+# Step 3: Detect fall intervals (pose keypoints are cached under data/cache/keypoints)
+keypoint_cache = KeypointCache(VIDEO_PATH, FPS, POSE_SETTINGS)
+fall_intervals = detect_fall_intervals(frames, fps=FPS, keypoint_cache=keypoint_cache)
 print(f"[DEBUG] Detected {len(fall_intervals)} fall intervals: {fall_intervals}")
 # Step 4: Summarize and classify
 # for start, end in fall_intervals:
@@ -30,4 +28,4 @@ print(f"[DEBUG] Detected {len(fall_intervals)} fall intervals: {fall_intervals}"
 #     summary = summarize_event_for_llm(event)
 #     print("Summary: ", summary)
 #     classification = classify_fall_event_with_llm(summary)
-#     print(f"[EVENT] {classification.upper()} at {start:.2f}s (duration: {end - start:.2f}s)")
\ No newline at end of file
+#     print(f"[EVENT] {classification.upper()} at {start:.2f}s (duration: {end - start:.2f}s)")